@@ -0,0 +1,373 @@
+"""Offline throughput benchmark for the PhishingChecker cog.
+
+Runs ``PhishingChecker.on_message`` and ``check_phishing_info`` against fake
+guild/message objects and a local aiohttp stub server, so neither Discord nor
+the network is needed. Every host name the cog connects to (feeds, shorteners,
+landing pages) is resolved to the stub, which answers based on the Host header:
+
+* ``feeds.bench.invalid`` serves a JSON and a hosts-file feed, with ETag support
+* ``bit.ly`` redirects to blocklisted or harmless landing pages
+* ``tinyurl.com`` redirects through three more hops before landing
+* ``is.gd`` answers slowly
+* ``t.co`` redirects in a loop
+
+Usage, from the repository root with Red-DiscordBot installed::
+
+    python benchmarks/bench_phishingchecker.py [--messages 5000] [--feed-size 50000]
+"""
+import argparse
+import asyncio
+import random
+import socket
+import string
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+import discord
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+FEED_HOST = "feeds.bench.invalid"
+SLOW_DELAY = 0.5
+
+
+def random_label(rng: random.Random, length: int = 10) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=length))
+
+
+class StubResolver(AbstractResolver):
+    """Resolve every host name to the local stub server."""
+
+    def __init__(self, port: int):
+        self.port = port
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        return [
+            {
+                "hostname": host,
+                "host": "127.0.0.1",
+                "port": self.port,
+                "family": socket.AF_INET,
+                "proto": 0,
+                "flags": socket.AI_NUMERICHOST,
+            }
+        ]
+
+    async def close(self):
+        pass
+
+
+class StubServer:
+    """Local stand-in for the feed hosts, the shorteners and the landing pages."""
+
+    def __init__(self, phishing: List[str], suspicious: List[str]):
+        self.phishing = phishing
+        self.suspicious = suspicious
+        self.requests = 0
+        self.runner: Optional[web.AppRunner] = None
+        self.port = 0
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+    def _feed(self, request: web.Request, body: str, etag: str) -> web.Response:
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        return web.Response(text=body, headers={"ETag": etag})
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        host = request.host.split(":")[0]
+        path = request.path.strip("/")
+        if host == FEED_HOST:
+            if path == "phishing.json":
+                body = '{"domains": [%s]}' % ",".join(f'"{domain}"' for domain in self.phishing)
+                return self._feed(request, body, '"phishing-1"')
+            if path == "suspicious.txt":
+                body = "".join(f"0.0.0.0 {domain}\n" for domain in self.suspicious)
+                return self._feed(request, body, '"suspicious-1"')
+            raise web.HTTPNotFound()
+        if host == "bit.ly":
+            index = int(path[1:])
+            if path.startswith("p"):
+                target = f"http://{self.phishing[index % len(self.phishing)]}/login"
+            else:
+                target = f"http://harmless-{index}.example/"
+            raise web.HTTPMovedPermanently(target)
+        if host == "tinyurl.com":
+            hops = int(path.split("-")[1]) if "-" in path else 3
+            if hops:
+                raise web.HTTPFound(f"http://tinyurl.com/{path.split('-')[0]}-{hops - 1}")
+            raise web.HTTPFound(f"http://bit.ly/{path.split('-')[0]}")
+        if host == "is.gd":
+            await asyncio.sleep(SLOW_DELAY)
+            raise web.HTTPFound(f"http://harmless-{path}.example/")
+        if host == "t.co":
+            raise web.HTTPFound(f"http://t.co/{path}x" if not path.endswith("x") else f"http://t.co/{path[:-1]}")
+        return web.Response(text="ok")
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+        self.sent = 0
+        self.deleted = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+
+    async def delete_messages(self, messages):
+        self.deleted += len(messages)
+
+
+class FakeUser:
+    bot = False
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+    def __str__(self):
+        return f"user{self.id}#0001"
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, guild: FakeGuild, channel: FakeChannel, author: FakeUser, content: str):
+        self.id = message_id
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.created_at = datetime.utcnow()
+        self.jump_url = f"https://discord.com/channels/{guild.id}/{channel.id}/{message_id}"
+
+    async def delete(self):
+        self.channel.deleted += 1
+
+
+class FakeBot:
+    def __init__(self, channels: Dict[int, FakeChannel]):
+        self.channels = channels
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channels.get(channel_id)
+
+    def get_guild(self, guild_id: int) -> None:
+        return None
+
+    async def get_embed_color(self, location):
+        return discord.Colour.red()
+
+    async def wait_until_ready(self):
+        pass
+
+
+class Corpus:
+    """Synthetic message contents with a given link density."""
+
+    def __init__(self, rng: random.Random, phishing: List[str], suspicious: List[str]):
+        self.rng = rng
+        self.phishing = phishing
+        self.suspicious = suspicious
+        self.words = [random_label(rng, rng.randint(2, 8)) for _ in range(500)]
+
+    def text(self, words: int = 12) -> str:
+        return " ".join(self.rng.choices(self.words, k=words))
+
+    def ordinary_link(self) -> str:
+        return f"https://{self.rng.choice(self.words)}-{self.rng.randint(0, 5000)}.example/{random_label(self.rng, 6)}"
+
+    def message(self, density: str) -> str:
+        rng = self.rng
+        if density == "none":
+            return self.text()
+        if density == "low":
+            return f"{self.text()} {self.ordinary_link()}" if rng.random() < 0.1 else self.text()
+        if density == "high":
+            links = [self.ordinary_link() for _ in range(rng.randint(1, 3))]
+            roll = rng.random()
+            if roll < 0.3:
+                links.append(f"http://bit.ly/b{rng.randint(0, 200)}")
+            elif roll < 0.35:
+                links.append(f"http://tinyurl.com/b{rng.randint(0, 50)}")
+            elif roll < 0.37:
+                links.append(f"http://is.gd/{rng.randint(0, 50)}")
+            elif roll < 0.38:
+                links.append(f"http://t.co/{rng.randint(0, 20)}")
+            return f"{self.text(6)} {' '.join(links)} {self.text(6)}"
+        if density == "raid":
+            roll = rng.random()
+            if roll < 0.5:
+                return f"free nitro http://{rng.choice(self.phishing[:20])}/gift"
+            if roll < 0.7:
+                return f"claim here http://bit.ly/p{rng.randint(0, 20)}"
+            if roll < 0.8:
+                return f"steam gift {rng.choice(self.phishing[:20])}"
+            return self.text()
+        raise ValueError(density)
+
+
+def summarize(name: str, latencies: List[float], elapsed: float) -> str:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    p50 = latencies[count // 2] * 1e3
+    p99 = latencies[min(count - 1, int(count * 0.99))] * 1e3
+    return f"{name:<34} {count:>7} {count / elapsed:>12.0f} {p50:>10.3f} {p99:>10.3f}"
+
+
+async def run_messages(cog, messages: List[FakeMessage], concurrency: int) -> Tuple[List[float], float]:
+    """Dispatch on_message like discord.py does, one task per message, bounded in flight."""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def dispatch(message):
+        async with semaphore:
+            start = time.perf_counter()
+            await cog.on_message(message)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(dispatch(message) for message in messages))
+    return latencies, time.perf_counter() - start
+
+
+async def run_urls(cog, urls: List[str]) -> Tuple[List[float], float]:
+    latencies = []
+    start = time.perf_counter()
+    for url in urls:
+        begin = time.perf_counter()
+        await cog.check_phishing_info(url)
+        latencies.append(time.perf_counter() - begin)
+    return latencies, time.perf_counter() - start
+
+
+async def main(args: argparse.Namespace) -> None:
+    from redbot.core import data_manager
+
+    data_dir = tempfile.TemporaryDirectory()
+    data_manager.basic_config = data_manager.basic_config_default
+    data_manager.basic_config["DATA_PATH"] = data_dir.name
+
+    from phishingchecker.domain_index import PHISHING, SUSPICIOUS
+    from phishingchecker.feeds import Feed
+    from phishingchecker.phishingchecker import PhishingChecker
+
+    rng = random.Random(args.seed)
+    phishing = [f"{random_label(rng)}-gift.{rng.choice(['ru', 'com', 'xyz'])}" for _ in range(args.feed_size)]
+    suspicious = [f"{random_label(rng)}.{rng.choice(['net', 'io'])}" for _ in range(args.feed_size // 5)]
+
+    stub = StubServer(phishing, suspicious)
+    await stub.start()
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(resolver=StubResolver(stub.port), limit=0))
+
+    channels = {channel_id: FakeChannel(channel_id) for channel_id in range(1000, 1010)}
+    bot = FakeBot(channels)
+    cog = PhishingChecker(bot)
+    await cog.session.close()
+    await cog.resolver.session.close()
+    cog.session = cog.feeds.session = cog.resolver.session = session
+    await cog.config.feeds.set(
+        [
+            Feed("bench-phishing", f"http://{FEED_HOST}/phishing.json", PHISHING, "json")._asdict(),
+            Feed("bench-suspicious", f"http://{FEED_HOST}/suspicious.txt", SUSPICIOUS, "hosts")._asdict(),
+        ]
+    )
+    await cog.initialize()
+
+    start = time.perf_counter()
+    await cog.refresh_checking_list()
+    compile_time = time.perf_counter() - start
+    start = time.perf_counter()
+    unchanged = not await cog.refresh_checking_list()
+    refresh_time = time.perf_counter() - start
+
+    guild = FakeGuild(1)
+    for key, value in (("enabled", True), ("action", "delete"), ("send_channel", "1000"), ("raid_threshold", 0)):
+        await cog.set_guild_setting(guild, key, value)
+
+    lines = [
+        f"Feeds: {len(cog.domain_index)} entries, {cog.domain_index.nbytes / 2**20:.1f} MiB resident, "
+        f"fetched and compiled in {compile_time:.2f}s; conditional refresh "
+        f"{'answered 304' if unchanged else 'changed?!'} in {refresh_time * 1e3:.1f}ms",
+        "",
+        f"{'scenario':<34} {'count':>7} {'per second':>12} {'p50 ms':>10} {'p99 ms':>10}",
+    ]
+
+    corpus = Corpus(rng, phishing, suspicious)
+    users = [FakeUser(user_id) for user_id in range(100, 400)]
+    next_id = 10**6
+    for density in ("none", "low", "high", "raid"):
+        if density == "raid":
+            await cog.set_guild_setting(guild, "raid_threshold", 5)
+        messages = []
+        for _ in range(args.messages):
+            next_id += 1
+            messages.append(
+                FakeMessage(next_id, guild, rng.choice(list(channels.values())), rng.choice(users), corpus.message(density))
+            )
+        cog.verdict_cache.clear()
+        latencies, elapsed = await run_messages(cog, messages, args.concurrency)
+        lines.append(summarize(f"on_message, {density} link density", latencies, elapsed))
+
+    urls = [corpus.ordinary_link() for _ in range(args.messages)]
+    cog.verdict_cache.clear()
+    lines.append(summarize("check_phishing_info, direct", *await run_urls(cog, urls)))
+    lines.append(summarize("check_phishing_info, cached", *await run_urls(cog, urls)))
+    urls = [f"http://bit.ly/{rng.choice('pb')}{i}" for i in range(min(args.messages, 500))]
+    lines.append(summarize("check_phishing_info, shortener", *await run_urls(cog, urls)))
+    urls = [f"http://tinyurl.com/b{i}" for i in range(50)]
+    lines.append(summarize("check_phishing_info, 4 hop chain", *await run_urls(cog, urls)))
+    urls = [f"http://is.gd/{i}" for i in range(20)]
+    lines.append(summarize(f"check_phishing_info, slow ({SLOW_DELAY}s)", *await run_urls(cog, urls)))
+    urls = [f"http://t.co/{i}" for i in range(20)]
+    lines.append(summarize("check_phishing_info, redirect loop", *await run_urls(cog, urls)))
+
+    # Let the alert workers drain before reporting what they did.
+    await asyncio.sleep(cog.alerts.window * 2)
+    lines.append("")
+    lines.append(
+        f"Alerts sent: {sum(channel.sent for channel in channels.values())}, "
+        f"messages deleted: {sum(channel.deleted for channel in channels.values())}, "
+        f"stub requests: {stub.requests}"
+    )
+
+    cog.cog_unload()
+    await session.close()
+    await stub.stop()
+    data_dir.cleanup()
+
+    report = "\n".join(lines)
+    print(report)
+    if args.output:
+        Path(args.output).write_text(report + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=5000, help="messages per scenario")
+    parser.add_argument("--feed-size", type=int, default=50000, help="entries in the phishing feed")
+    parser.add_argument("--concurrency", type=int, default=200, help="on_message calls in flight")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report to this file")
+    asyncio.run(main(parser.parse_args()))
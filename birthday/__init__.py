@@ -0,0 +1,5 @@
+from .birthday import Birthday
+
+
+def setup(bot):
+    bot.add_cog(Birthday(bot))
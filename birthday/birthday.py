@@ -2,13 +2,27 @@ from redbot.core import commands, Config, checks
 from redbot.core.commands import Context, Cog
 from redbot.core.utils.chat_formatting import *
 from redbot.core.utils.predicates import MessagePredicate
-from redbot.core.utils.menus import menu, DEFAULT_CONTROLS
 
 from dateutil import parser
 import asyncio
+import calendar
 import datetime
+import time
 import discord
-from typing import Literal
+from typing import List, Literal
+
+from .dispatcher import JobDispatcher
+from .index import BirthdayIndex, next_occurrence
+from .menus import LazyPages, lazy_menu
+from .scheduler import GuildScheduler, get_timezone, last_due_day, local_today, next_run
+from .transfer import FORMATS, read_birthdays, write_birthdays
+
+# Birthdays shown per page of bday list
+LIST_PAGE_SIZE = 15
+# Missed days still announced after downtime, older ones are skipped
+MAX_CATCH_UP_DAYS = 7
+# Imported birthdays written to Config at once
+IMPORT_BATCH_SIZE = 5000
 
 
 class Birthday(commands.Cog):
@@ -23,13 +37,26 @@ class Birthday(commands.Cog):
             "channel": None,
             "role": None,
             "dm_message": ":tada: Aurelia wishes you a very happy birthday! :tada:",
+            "timezone": "UTC",
+            "hour": 0,
+            # birthday jobs not run yet, see JobDispatcher
+            "pending": [],
+            # members whose birthday today has been handled
+            "handled": [],
+            # ISO date of the last day birthdays were handled for
+            "last_run": None,
         }
 
-        default_member = {"birthday": None, "birthday_handeled": False}
+        # birthday is [month, day, year], year being None if not given
+        default_member = {"birthday": None}
 
+        self.config.register_global(schema_version=0)
         self.config.register_guild(**default_guild)
         self.config.register_member(**default_member)
 
+        self.index = BirthdayIndex()
+        self.scheduler = GuildScheduler(self.run_guild)
+        self.dispatcher = JobDispatcher(self.config, self.run_job)
         self.bday_task = asyncio.create_task(self.initialise())
 
     @staticmethod
@@ -37,96 +64,163 @@ class Birthday(commands.Cog):
         return parser.parse(date)
 
     @staticmethod
-    def get_date_and_age(date: datetime):
-        today = datetime.datetime.utcnow()
-        if date.year != today.year:
-            age = today.year - date.year
-            date = date.strftime("%b %d, %Y")
-        else:
-            date = date.strftime("%b %d")
-            age = None
+    def parse_legacy_birthday(date: str):
+        """Convert a birthday stored as a "%m/%d" or "%m/%d/%Y" string."""
+        try:
+            month, day, year = int(date[0:2]), int(date[3:5]), int(date[6:]) if len(date) > 5 else None
+            datetime.date(year or 2000, month, day)
+        except (TypeError, ValueError):
+            return None
+        return [month, day, year]
 
-        return date, age
+    @staticmethod
+    def describe_birthday(birthday: list, today: datetime.date):
+        month, day, year = birthday
+        # 2000 is a leap year, so Feb 29 can be formatted without a year
+        date = datetime.date(year or 2000, month, day)
+        if not year:
+            return date.strftime("%b %d")
+        if (month, day) == (today.month, today.day):
+            return f"{date:%b %d, %Y}, turns {today.year - year} today"
+        next_year = today.year + 1 if (month, day) < (today.month, today.day) else today.year
+        return f"{date:%b %d, %Y}, turning {next_year - year}"
 
     def cog_unload(self):
         self.bday_task.cancel()
 
+    async def migrate(self):
+        if await self.config.schema_version() >= 2:
+            return
+        handled = {}
+        # one write for every stored member instead of one per member
+        async with self.config._get_base_group(Config.MEMBER)() as guilds:
+            for guild_id, members in guilds.items():
+                for member_id, data in members.items():
+                    # 1: birthdays were "%m/%d" or "%m/%d/%Y" strings
+                    if isinstance(data.get("birthday"), str):
+                        data["birthday"] = self.parse_legacy_birthday(data["birthday"])
+                    # 2: handled flags were kept per member
+                    if data.pop("birthday_handeled", False):
+                        handled.setdefault(int(guild_id), []).append(int(member_id))
+        for guild_id, member_ids in handled.items():
+            await self.config.guild_from_id(guild_id).handled.set(member_ids)
+        await self.config.schema_version.set(2)
+
     async def initialise(self):
+        await self.migrate()
+        self.index.load(await self.config.all_members())
         await self.bot.wait_until_ready()
-        while True:
-            now = datetime.datetime.utcnow()
-            tomorrow = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-            # check bdays once a day, at utc midnight
-            await self.check_bdays()
-            await asyncio.sleep((tomorrow - now).total_seconds())
-            ### TESTING:
-            # await asyncio.sleep(30)
-
-    async def check_bdays(self):
         for guild in self.bot.guilds:
-            if await self.bot.cog_disabled_in_guild(self, guild):
-                continue
-            for member in guild.members:
-                await self.check_member_bday(member)
+            self.schedule_guild(guild.id, await self.config.guild(guild).all())
+        await self.scheduler.run()
+
+    @staticmethod
+    def missed_days(settings: dict) -> List[datetime.date]:
+        """Days due since the guild's last run, oldest first"""
+        due = last_due_day(settings["timezone"], settings["hour"])
+        if settings["last_run"] is None:
+            return [due]
+        first = max(
+            datetime.date.fromisoformat(settings["last_run"]) + datetime.timedelta(days=1),
+            due - datetime.timedelta(days=MAX_CATCH_UP_DAYS - 1),
+        )
+        return [first + datetime.timedelta(days=offset) for offset in range((due - first).days + 1)]
+
+    def schedule_guild(self, guild_id: int, settings: dict):
+        """Run the guild right away if it has missed days or unfinished jobs, else at its next hour"""
+        if settings["pending"] or self.missed_days(settings):
+            self.scheduler.schedule(guild_id, time.time())
+        else:
+            self.scheduler.schedule(guild_id, next_run(settings["timezone"], settings["hour"]).timestamp())
 
-    async def check_member_bday(self, member: discord.Member):
-        today = datetime.datetime.utcnow().date()
-        bday = await self.config.member(member).birthday()
+    async def run_guild(self, guild_id: int):
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return
+        settings = await self.config.guild(guild).all()
         try:
-            bday = self.parse_date(bday).date()
-        except:
-            # no bday for user
+            if await self.bot.cog_disabled_in_guild(self, guild):
+                return
+            days = self.missed_days(settings)
+            if days:
+                await self.check_bdays(guild, settings, days)
+            else:
+                # only jobs interrupted by a restart are left
+                await self.dispatcher.run(guild)
+        finally:
+            self.scheduler.schedule(guild_id, next_run(settings["timezone"], settings["hour"]).timestamp())
+
+    async def check_bdays(self, guild: discord.Guild, settings: dict, days: List[datetime.date]):
+        """Handle the birthdays of ``days``, the last of which is today
+        Birthdays of earlier, missed days are still wished a happy birthday, without the role.
+        """
+        today = days[-1]
+        celebrating = self.index.on(guild.id, today)
+        handled = set(settings["handled"])
+        jobs = []
+        # whoever still has the role is done celebrating, this also catches roles left
+        # behind by a crash or by birthdays that were changed in the meantime
+        role = guild.get_role(settings["role"])
+        if role:
+            jobs += [["remove_role", member.id] for member in role.members if member.id not in celebrating]
+
+        due = {member_id: day for day in days[:-1] for member_id in self.index.on(guild.id, day)}
+        due.update((member_id, today) for member_id in celebrating - handled)
+        for member_id, day in due.items():
+            if guild.get_member(member_id) is None:
+                continue
+            birthday = await self.config.member_from_ids(guild.id, member_id).birthday()
+            if not birthday:
+                continue
+            year = birthday[2]
+            age = day.year - year if year and year != day.year else None
+            jobs += [["dm", member_id], ["announce", member_id, age]]
+            if day == today:
+                jobs.append(["add_role", member_id])
+                handled.add(member_id)
+
+        # yesterday's birthdays drop out of the handled set, cya next year!
+        handled &= celebrating
+        # queue the jobs before marking the days done, a crash in between queues them
+        # again but already queued jobs are not added twice
+        await self.dispatcher.add(guild, jobs)
+        if handled != set(settings["handled"]):
+            await self.config.guild(guild).handled.set(list(handled))
+        await self.config.guild(guild).last_run.set(today.isoformat())
+        await self.dispatcher.run(guild)
+
+    async def run_job(self, guild: discord.Guild, settings: dict, job: list):
+        kind, member_id, *args = job
+        member = guild.get_member(member_id)
+        if member is None:
             return
-        year = bday.year
-        bday = bday.replace(year=today.year)
-
-        handled = await self.config.member(member).birthday_handeled()
-        if bday == today:
-            if not handled:
-                # dm user
-                dm = await self.config.guild(member.guild).dm_message()
-                try:
-                    await member.send(dm)
-                except:
-                    pass
-                # send bday in channel
-                channel = await self.config.guild(member.guild).channel()
-                channel = self.bot.get_channel(channel)
-                if channel:
-                    embed = discord.Embed(color=discord.Colour.gold())
-                    if year != today.year:
-                        age = today.year - year
-                        embed.description = f"{member.mention} is now **{age} years old!**"
-                    else:
-                        embed.description = f"Happy Birthday to {member.mention}!"
-                    # embed.set_footer("Add your birthday using the `bday` command!")
-                    try:
-                        await channel.send(embed=embed, allowed_mentions=discord.AllowedMentions.all())
-                    except:
-                        pass
-
-                # add role, if available
-                role = await self.config.guild(member.guild).role()
-                role = member.guild.get_role(role)
-                if role:
-                    try:
-                        await member.add_roles(role, reason="Birthday cog")
-                    except:
-                        pass
-
-                await self.config.member(member).birthday_handeled.set(True)
+        if kind == "dm":
+            await member.send(settings["dm_message"])
+        elif kind == "announce":
+            channel = self.bot.get_channel(settings["channel"])
+            if channel:
+                embed = discord.Embed(color=discord.Colour.gold())
+                if args[0]:
+                    embed.description = f"{member.mention} is now **{args[0]} years old!**"
+                else:
+                    embed.description = f"Happy Birthday to {member.mention}!"
+                # embed.set_footer("Add your birthday using the `bday` command!")
+                await channel.send(embed=embed, allowed_mentions=discord.AllowedMentions.all())
         else:
-            if handled:
-                # remove bday role
-                role = await self.config.guild(member.guild).role()
-                role = member.guild.get_role(role)
-                if role:
-                    try:
-                        await member.remove_roles(role, reason="Birthday cog")
-                    except:
-                        pass
-                # unhandled their birthday, cya next year!
-                await self.config.member(member).birthday_handeled.set(False)
+            role = guild.get_role(settings["role"])
+            if role:
+                if kind == "add_role":
+                    await member.add_roles(role, reason="Birthday cog")
+                else:
+                    await member.remove_roles(role, reason="Birthday cog")
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        self.schedule_guild(guild.id, await self.config.guild(guild).all())
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.scheduler.unschedule(guild.id)
 
     # @commands.command()
     # async def test(self, ctx, *, member: discord.Member):
@@ -173,6 +267,33 @@ class Birthday(commands.Cog):
 
         await ctx.tick()
 
+    @bdayset.command(name="timezone")
+    async def bdayset_timezone(self, ctx, *, timezone: str = None):
+        """Set the timezone birthdays are announced in, like `Europe/Berlin` or `America/New_York`
+        Leave empty to reset to UTC
+        """
+        if not timezone:
+            await self.config.guild(ctx.guild).timezone.clear()
+        elif get_timezone(timezone) is None:
+            await ctx.send(error("Unknown timezone!"))
+            return
+        else:
+            await self.config.guild(ctx.guild).timezone.set(timezone)
+
+        self.schedule_guild(ctx.guild.id, await self.config.guild(ctx.guild).all())
+        await ctx.tick()
+
+    @bdayset.command(name="hour")
+    async def bdayset_hour(self, ctx, hour: int):
+        """Set the hour of the day (0-23, in the server's timezone) birthdays are announced at"""
+        if not 0 <= hour <= 23:
+            await ctx.send(error("Hour must be between 0 and 23!"))
+            return
+
+        await self.config.guild(ctx.guild).hour.set(hour)
+        self.schedule_guild(ctx.guild.id, await self.config.guild(ctx.guild).all())
+        await ctx.tick()
+
     @bdayset.command(name="role")
     @checks.bot_has_permissions(manage_roles=True)
     async def bdayset_role(self, ctx, *, role: discord.Role = None):
@@ -184,6 +305,82 @@ class Birthday(commands.Cog):
 
         await ctx.tick()
 
+    async def store_birthdays(self, guild: discord.Guild, birthdays: dict):
+        """Set many birthdays of a guild in one Config write"""
+        async with self.config._get_base_group(Config.MEMBER, str(guild.id))() as members:
+            for member_id, birthday in birthdays.items():
+                members.setdefault(str(member_id), {})["birthday"] = birthday
+
+    @bdayset.command(name="import")
+    @checks.is_owner()
+    async def bdayset_import(self, ctx):
+        """Import birthdays from an attached CSV or JSON file
+        CSV rows are `user id,birthday`, JSON is a list of `{"user_id": ..., "birthday": ...}` objects.
+        Birthdays are written as MM/DD, MM/DD/YYYY or YYYY-MM-DD.
+        Birthdays already set for the imported users are replaced.
+        """
+        if not ctx.message.attachments:
+            await self.bot.send_help_for(ctx, "bdayset import")
+            return
+
+        attachment = ctx.message.attachments[0]
+        file_format = "json" if attachment.filename.lower().endswith(".json") else "csv"
+        imported = invalid = rows = 0
+        batch = {}
+        async with ctx.typing():
+            try:
+                data = await attachment.read()
+            except discord.HTTPException:
+                await ctx.send(error("Could not download the file!"))
+                return
+            try:
+                for member_id, birthday in read_birthdays(data, file_format):
+                    rows += 1
+                    if member_id is None or birthday is None:
+                        invalid += 1
+                        continue
+                    batch[member_id] = birthday
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        await self.store_birthdays(ctx.guild, batch)
+                        imported += len(batch)
+                        batch = {}
+            except ValueError as exc:
+                # the unfinished batch is dropped, the batches before it are already saved
+                if imported:
+                    self.index.load_guild(ctx.guild.id, await self.config.all_members(ctx.guild))
+                    outcome = (
+                        f"Only the first {humanize_number(imported)} birthdays were imported, "
+                        "the rest of the file was not."
+                    )
+                else:
+                    outcome = "Nothing was imported."
+                await ctx.send(
+                    error(f"Could not read the file after row {humanize_number(rows)}: {exc}\n{outcome}")
+                )
+                return
+            if batch:
+                await self.store_birthdays(ctx.guild, batch)
+                imported += len(batch)
+            self.index.load_guild(ctx.guild.id, await self.config.all_members(ctx.guild))
+
+        await ctx.send(
+            f"Imported {humanize_number(imported)} birthdays, skipped {humanize_number(invalid)} invalid rows."
+        )
+
+    @bdayset.command(name="export")
+    @checks.is_owner()
+    async def bdayset_export(self, ctx, file_format: str = "csv"):
+        """Export the server's birthdays as a CSV or JSON file, in the format import reads"""
+        file_format = file_format.lower()
+        if file_format not in FORMATS:
+            await ctx.send(error(f"Format must be one of {humanize_list(FORMATS)}!"))
+            return
+
+        members = await self.config.all_members(ctx.guild)
+        rows = ((member_id, data["birthday"]) for member_id, data in members.items() if data["birthday"])
+        fp = write_birthdays(rows, file_format)
+        await ctx.send(file=discord.File(fp, filename=f"birthdays-{ctx.guild.id}.{file_format}"))
+
     @commands.group(name="bday")
     @commands.guild_only()
     async def bday(self, ctx):
@@ -216,6 +413,7 @@ class Birthday(commands.Cog):
                 return
             if pred.result:
                 await self.config.member(ctx.author).birthday.clear()
+                self.index.remove(ctx.guild.id, ctx.author.id)
                 await ctx.tick()
             else:
                 await ctx.send("Nothing Changed.")
@@ -235,41 +433,109 @@ class Birthday(commands.Cog):
             await ctx.send(error("Invalid Date!"))
             return
 
-        if date.year == today.year:
-            date = date.strftime("%m/%d")
-        else:
-            date = date.strftime("%m/%d/%Y")
-
-        await self.config.member(ctx.author).birthday.set(date)
+        # a date without a year is parsed as this year
+        year = date.year if date.year != today.year else None
+        await self.config.member(ctx.author).birthday.set([date.month, date.day, year])
+        self.index.add(ctx.guild.id, ctx.author.id, (date.month, date.day))
         await ctx.tick()
 
+    async def show_birthdays(self, ctx, title: str, entries: list, describe):
+        """Page through ``(member, value)`` entries, a line of ``describe(value)`` each"""
+        page_count = (len(entries) + LIST_PAGE_SIZE - 1) // LIST_PAGE_SIZE
+
+        def render(index):
+            embed = discord.Embed(title=title, colour=ctx.guild.me.colour)
+            embed.description = "\n".join(
+                f"**{escape(member.display_name, formatting=True)}**: {describe(value)}"
+                for member, value in entries[index * LIST_PAGE_SIZE : (index + 1) * LIST_PAGE_SIZE]
+            )
+            embed.set_footer(text=f"Page {index + 1} of {page_count}")
+            return embed
+
+        await lazy_menu(ctx, LazyPages(page_count, render))
+
     @bday.command(name="list")
     async def bday_list(self, ctx):
-        """List birthdays in the server"""
-        embeds = []
-        for member in ctx.guild.members:
-            bday = await self.config.member(member).birthday()
-            if bday:
-                embed = discord.Embed(title=f"{member.display_name}", colour=ctx.guild.me.colour)
-                bday_datetime = self.parse_date(bday)
-                bday, age = self.get_date_and_age(bday_datetime)
-                embed.add_field(name="Birthday", value=bday)
-                if age:
-                    now = datetime.datetime.utcnow()
-                    bday_datetime = bday_datetime.replace(year=now.year)
-                    if now > bday_datetime:
-                        embed.add_field(name="Turned", value=age)
-                    else:
-                        embed.add_field(name="Turning", value=age)
-                embeds.append(embed)
-
-        for i, embed in enumerate(embeds):
-            embed.set_footer(text=f"Page {i+1} of {len(embeds)}")
-
-        if not embeds:
+        """List birthdays in the server, soonest first"""
+        today = local_today(await self.config.guild(ctx.guild).timezone())
+        members = await self.config.all_members(ctx.guild)
+        entries = []
+        # the index already has the guild's birthdays in order of next occurrence
+        for member_id in self.index.upcoming(ctx.guild.id, today):
+            member = ctx.guild.get_member(member_id)
+            if member is not None and members.get(member_id, {}).get("birthday"):
+                entries.append((member, members[member_id]["birthday"]))
+
+        if not entries:
+            await ctx.send("No one has their birthday set in your server!")
+            return
+
+        await self.show_birthdays(
+            ctx, f"Birthdays in {ctx.guild.name}", entries, lambda bday: self.describe_birthday(bday, today)
+        )
+
+    @bday.command(name="upcoming")
+    async def bday_upcoming(self, ctx, count: int = 10):
+        """Show the next birthdays in the server"""
+        today = local_today(await self.config.guild(ctx.guild).timezone())
+        entries = []
+        for member_id in self.index.upcoming(ctx.guild.id, today):
+            if len(entries) >= max(count, 1):
+                break
+            member = ctx.guild.get_member(member_id)
+            if member is not None:
+                entries.append((member, next_occurrence(self.index.month_day(ctx.guild.id, member_id), today)))
+
+        if not entries:
             await ctx.send("No one has their birthday set in your server!")
+            return
+
+        def describe(date):
+            days = (date - today).days
+            when = "today" if days == 0 else "tomorrow" if days == 1 else f"in {days} days"
+            return f"{date:%b %d}, {when}"
+
+        await self.show_birthdays(ctx, f"Upcoming birthdays in {ctx.guild.name}", entries, describe)
+
+    @bday.command(name="month")
+    async def bday_month(self, ctx, *, month: str = None):
+        """Show the birthdays in a month, this month if none is given
+        Month can be a number or a name, like 5, May or may
+        """
+        today = local_today(await self.config.guild(ctx.guild).timezone())
+        if month is None:
+            number = today.month
+        elif month.isdigit() and 1 <= int(month) <= 12:
+            number = int(month)
         else:
-            await menu(ctx, embeds, DEFAULT_CONTROLS)
+            names = {
+                name.lower(): number
+                for names in (calendar.month_name, calendar.month_abbr)
+                for number, name in enumerate(names)
+                if name
+            }
+            number = names.get(month.lower())
+            if number is None:
+                await ctx.send(error("Invalid month!"))
+                return
+
+        last_day = calendar.monthrange(2000, number)[1]
+        entries = []
+        for member_id in self.index.between(ctx.guild.id, (number, 1), (number, last_day)):
+            member = ctx.guild.get_member(member_id)
+            if member is not None:
+                entries.append((member, self.index.month_day(ctx.guild.id, member_id)))
+
+        if not entries:
+            await ctx.send(f"No one has their birthday in {calendar.month_name[number]}!")
+            return
+
+        await self.show_birthdays(
+            ctx,
+            f"Birthdays in {calendar.month_name[number]}",
+            entries,
+            lambda month_day: datetime.date(2000, *month_day).strftime("%b %d"),
+        )
 
     async def red_delete_data_for_user(
         self,
@@ -0,0 +1,104 @@
+"""Queued, resumable delivery of birthday DMs, announcements and role changes."""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import discord
+from redbot.core import Config
+
+log = logging.getLogger("red.nyancogs.birthday")
+
+# Jobs of one guild run at the same time.
+JOB_CONCURRENCY = 4
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+# The saved queue is rewritten once this many jobs finished, or this many seconds passed, since the last save.
+SAVE_EVERY = 25
+SAVE_INTERVAL = 5.0
+
+# A job is [kind, member id, *arguments], kind being "dm", "announce", "add_role" or "remove_role".
+Job = list
+
+
+def retry_after(exc: discord.HTTPException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers["Retry-After"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class JobDispatcher:
+    """Runs the birthday jobs of each guild from a queue kept in the guild's ``pending`` setting.
+
+    Finished jobs are removed from the saved queue in batches, so after a
+    restart only the jobs that had not run yet, and at most the last batch
+    of finished ones, are run again. Rate limited
+    and server side failures are retried with backoff, other HTTP errors
+    (closed DMs, missing permissions) drop the job.
+    """
+
+    def __init__(self, config: Config, execute: Callable[[discord.Guild, dict, Job], Awaitable[None]]):
+        self.config = config
+        self.execute = execute
+        self._locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def add(self, guild: discord.Guild, jobs: List[Job]) -> None:
+        """Queue ``jobs``, skipping those already queued."""
+        if not jobs:
+            return
+        async with self._locks[guild.id]:
+            async with self.config.guild(guild).pending() as pending:
+                pending.extend(job for job in jobs if job not in pending)
+
+    async def _attempt(self, guild: discord.Guild, settings: dict, job: Job) -> None:
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                await self.execute(guild, settings, job)
+                return
+            except discord.HTTPException as exc:
+                if exc.status != 429 and exc.status < 500:
+                    log.debug("Dropping birthday job %s in guild %s: %r", job, guild.id, exc)
+                    return
+                await asyncio.sleep(retry_after(exc) or BACKOFF_BASE * 2 ** attempt)
+            except Exception:
+                log.exception("Birthday job %s in guild %s failed", job, guild.id)
+                return
+        log.warning("Giving up on birthday job %s in guild %s after %s attempts", job, guild.id, MAX_ATTEMPTS)
+
+    async def run(self, guild: discord.Guild) -> None:
+        """Run the guild's queued jobs."""
+        async with self._locks[guild.id]:
+            settings = await self.config.guild(guild).all()
+            # queue position -> job, so a finished job is dropped without searching the list
+            remaining: Dict[int, Job] = dict(enumerate(settings["pending"]))
+            if not remaining:
+                return
+            semaphore = asyncio.Semaphore(JOB_CONCURRENCY)
+            save_lock = asyncio.Lock()
+            unsaved = 0
+            last_save = time.monotonic()
+
+            async def save() -> None:
+                nonlocal unsaved, last_save
+                unsaved = 0
+                last_save = time.monotonic()
+                await self.config.guild(guild).pending.set(list(remaining.values()))
+
+            async def run_job(position: int, job: Job) -> None:
+                nonlocal unsaved
+                async with semaphore:
+                    await self._attempt(guild, settings, job)
+                del remaining[position]
+                unsaved += 1
+                if unsaved >= SAVE_EVERY or time.monotonic() - last_save >= SAVE_INTERVAL:
+                    # saves happen in order, so the last one written is the latest
+                    async with save_lock:
+                        if unsaved:
+                            await save()
+
+            await asyncio.gather(*(run_job(position, job) for position, job in list(remaining.items())))
+            if unsaved:
+                await save()
@@ -0,0 +1,127 @@
+"""In-memory index of the stored birthdays, so daily work only touches the day's birthdays."""
+import calendar
+import datetime
+from bisect import bisect_left, insort
+from itertools import accumulate
+from typing import Dict, Iterator, List, Set, Tuple
+
+MonthDay = Tuple[int, int]
+LEAP_DAY = (2, 29)
+
+# Days before each month in a leap year, so every month-day has its own day of the year.
+_MONTH_OFFSETS = (0, *accumulate(calendar.monthrange(2000, month)[1] for month in range(1, 12)))
+
+
+def day_of_year(month: int, day: int) -> int:
+    """Day of the year of a month-day, counted as in a leap year (Feb 29 is 60, Dec 31 is 366)."""
+    return _MONTH_OFFSETS[month - 1] + day
+
+
+def celebrated_on(date: datetime.date) -> Tuple[MonthDay, ...]:
+    """Month-days celebrated on ``date``. Leap day birthdays are celebrated on Feb 28 in common years."""
+    if (date.month, date.day) == (2, 28) and not calendar.isleap(date.year):
+        return (2, 28), LEAP_DAY
+    return ((date.month, date.day),)
+
+
+def next_occurrence(month_day: MonthDay, today: datetime.date) -> datetime.date:
+    """The date a birthday is next celebrated on, ``today`` included."""
+    for year in (today.year, today.year + 1):
+        if month_day == LEAP_DAY and not calendar.isleap(year):
+            date = datetime.date(year, 2, 28)
+        else:
+            date = datetime.date(year, *month_day)
+        if date >= today:
+            return date
+
+
+class BirthdayIndex:
+    """Member ids of every guild, keyed by the month and day of their birthday.
+
+    Besides the month-day lookup, each guild keeps its birthdays as
+    (day of year, member id) pairs in a sorted list, so the next birthdays
+    after a date, or those within a range of dates, are found with a bisect.
+    """
+
+    def __init__(self):
+        # guild id -> (month, day) -> member ids
+        self._days: Dict[int, Dict[MonthDay, Set[int]]] = {}
+        # guild id -> member id -> (month, day)
+        self._members: Dict[int, Dict[int, MonthDay]] = {}
+        # guild id -> sorted (day of year, member id)
+        self._sorted: Dict[int, List[Tuple[int, int]]] = {}
+
+    def load(self, all_members: Dict[int, Dict[int, dict]]) -> None:
+        """Build the index from ``Config.all_members()``."""
+        self._days.clear()
+        self._members.clear()
+        self._sorted.clear()
+        for guild_id, members in all_members.items():
+            self.load_guild(guild_id, members)
+
+    def load_guild(self, guild_id: int, members: Dict[int, dict]) -> None:
+        """Rebuild one guild's index from ``Config.all_members(guild)``."""
+        indexed = self._members[guild_id] = {}
+        days = self._days[guild_id] = {}
+        for member_id, data in members.items():
+            if data.get("birthday"):
+                month, day, _ = data["birthday"]
+                indexed[member_id] = (month, day)
+                days.setdefault((month, day), set()).add(member_id)
+        # one sort instead of an insort per member
+        self._sorted[guild_id] = sorted(
+            (day_of_year(*month_day), member_id) for member_id, month_day in indexed.items()
+        )
+
+    def add(self, guild_id: int, member_id: int, month_day: MonthDay) -> None:
+        self.remove(guild_id, member_id)
+        self._members.setdefault(guild_id, {})[member_id] = month_day
+        self._days.setdefault(guild_id, {}).setdefault(month_day, set()).add(member_id)
+        insort(self._sorted.setdefault(guild_id, []), (day_of_year(*month_day), member_id))
+
+    def remove(self, guild_id: int, member_id: int) -> None:
+        month_day = self._members.get(guild_id, {}).pop(member_id, None)
+        if month_day is None:
+            return
+        days = self._days[guild_id]
+        days[month_day].discard(member_id)
+        if not days[month_day]:
+            del days[month_day]
+        entries = self._sorted[guild_id]
+        del entries[bisect_left(entries, (day_of_year(*month_day), member_id))]
+
+    def on(self, guild_id: int, date: datetime.date) -> Set[int]:
+        """Ids of the members of a guild celebrating their birthday on ``date``."""
+        days = self._days.get(guild_id)
+        if not days:
+            return set()
+        members = set()
+        for month_day in celebrated_on(date):
+            members.update(days.get(month_day, ()))
+        return members
+
+    def month_day(self, guild_id: int, member_id: int) -> MonthDay:
+        return self._members[guild_id][member_id]
+
+    def upcoming(self, guild_id: int, date: datetime.date) -> Iterator[int]:
+        """Member ids in the order of their next birthday from ``date`` on, wrapping around the year end."""
+        entries = self._sorted.get(guild_id, [])
+        start = bisect_left(entries, (day_of_year(date.month, date.day),))
+        count = len(entries)
+        for offset in range(count):
+            yield entries[(start + offset) % count][1]
+
+    def between(self, guild_id: int, start: MonthDay, end: MonthDay) -> List[int]:
+        """Member ids with a birthday from ``start`` to ``end`` inclusive, in date order.
+
+        If ``end`` comes before ``start``, the range wraps around the year end.
+        """
+        entries = self._sorted.get(guild_id, [])
+        first, last = day_of_year(*start), day_of_year(*end)
+        low = bisect_left(entries, (first,))
+        high = bisect_left(entries, (last + 1,))
+        found = entries[low:high] if first <= last else entries[low:] + entries[:high]
+        return [member_id for _, member_id in found]
+
+    def __len__(self) -> int:
+        return sum(len(members) for members in self._members.values())
@@ -0,0 +1,64 @@
+"""Reaction menu over pages rendered only when they are first shown."""
+import asyncio
+from typing import Callable, Dict
+
+import discord
+from redbot.core import commands
+from redbot.core.utils.menus import start_adding_reactions
+from redbot.core.utils.predicates import ReactionPredicate
+
+PREVIOUS, CLOSE, NEXT = (
+    "\N{LEFTWARDS BLACK ARROW}\N{VARIATION SELECTOR-16}",
+    "\N{CROSS MARK}",
+    "\N{BLACK RIGHTWARDS ARROW}\N{VARIATION SELECTOR-16}",
+)
+
+
+class LazyPages:
+    """``count`` pages, each rendered by ``render(index)`` the first time it is needed."""
+
+    def __init__(self, count: int, render: Callable[[int], discord.Embed]):
+        self.count = count
+        self.render = render
+        self._rendered: Dict[int, discord.Embed] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> discord.Embed:
+        page = self._rendered.get(index)
+        if page is None:
+            page = self._rendered[index] = self.render(index)
+        return page
+
+
+async def lazy_menu(ctx: commands.Context, pages: LazyPages, timeout: float = 60.0) -> None:
+    """Like Red's ``menu`` with the default controls, without needing every page up front."""
+    message = await ctx.send(embed=pages[0])
+    if len(pages) == 1:
+        return
+    emojis = [PREVIOUS, CLOSE, NEXT]
+    start_adding_reactions(message, emojis)
+    page = 0
+    while True:
+        pred = ReactionPredicate.with_emojis(emojis, message, ctx.author)
+        try:
+            await ctx.bot.wait_for("reaction_add", check=pred, timeout=timeout)
+        except asyncio.TimeoutError:
+            try:
+                await message.clear_reactions()
+            except discord.HTTPException:
+                pass
+            return
+        if emojis[pred.result] == CLOSE:
+            try:
+                await message.delete()
+            except discord.HTTPException:
+                pass
+            return
+        page = (page + (1 if emojis[pred.result] == NEXT else -1)) % len(pages)
+        try:
+            await message.remove_reaction(emojis[pred.result], ctx.author)
+        except discord.HTTPException:
+            pass
+        await message.edit(embed=pages[page])
@@ -0,0 +1,110 @@
+"""Scheduling of each guild's daily birthday run at its own local hour."""
+import asyncio
+import datetime
+import heapq
+import logging
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from dateutil.tz import UTC, gettz, resolve_imaginary
+from dateutil.zoneinfo import get_zonefile_instance
+
+log = logging.getLogger("red.nyancogs.birthday")
+
+# An IANA Area/Location name, for zones newer than the list bundled with dateutil.
+IANA_NAME_RE = re.compile(r"^[A-Za-z]+(?:/[A-Za-z0-9_+-]+)+$")
+
+
+def get_timezone(name: str) -> Optional[datetime.tzinfo]:
+    """The IANA timezone called ``name``, or None if there is no such timezone.
+
+    gettz also reads file paths and POSIX TZ strings, where UTC+5 means five
+    hours behind UTC, so only IANA zone names are passed on to it.
+    """
+    # gettz("") would return the bot's local timezone
+    if not name or (name not in get_zonefile_instance().zones and not IANA_NAME_RE.match(name)):
+        return None
+    try:
+        return gettz(name)
+    except ValueError:
+        return None
+
+
+def local_today(timezone: str) -> datetime.date:
+    return datetime.datetime.now(get_timezone(timezone) or UTC).date()
+
+
+def last_due_day(timezone: str, hour: int, now: Optional[datetime.datetime] = None) -> datetime.date:
+    """The latest date in ``timezone`` that has reached ``hour`` o'clock by ``now``."""
+    local = (now or datetime.datetime.now(UTC)).astimezone(get_timezone(timezone) or UTC)
+    return local.date() if local.hour >= hour else local.date() - datetime.timedelta(days=1)
+
+
+def next_run(timezone: str, hour: int, now: Optional[datetime.datetime] = None) -> datetime.datetime:
+    """The next time it is ``hour`` o'clock in ``timezone`` after ``now``."""
+    local = (now or datetime.datetime.now(UTC)).astimezone(get_timezone(timezone) or UTC)
+    run = local.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if run <= local:
+        run += datetime.timedelta(days=1)
+    # an hour skipped by a DST change runs at the first moment after it instead
+    return resolve_imaginary(run)
+
+
+class GuildScheduler:
+    """A single task sleeping until the next guild is due.
+
+    Due times are kept in a min-heap. Rescheduling a guild pushes a new entry
+    and bumps the guild's generation, so its older entries are skipped when
+    they reach the top instead of being searched for and removed.
+    """
+
+    def __init__(self, callback: Callable[[int], Awaitable[None]]):
+        self.callback = callback
+        # (due timestamp, guild id, generation)
+        self._heap: List[Tuple[float, int, int]] = []
+        self._generations: Dict[int, int] = {}
+        self._wakeup = asyncio.Event()
+        self._running: Set[asyncio.Task] = set()
+
+    def schedule(self, guild_id: int, when: float) -> None:
+        generation = self._generations.get(guild_id, 0) + 1
+        self._generations[guild_id] = generation
+        heapq.heappush(self._heap, (when, guild_id, generation))
+        self._wakeup.set()
+
+    def unschedule(self, guild_id: int) -> None:
+        self._generations.pop(guild_id, None)
+
+    def _drop_stale(self) -> None:
+        while self._heap and self._generations.get(self._heap[0][1]) != self._heap[0][2]:
+            heapq.heappop(self._heap)
+
+    async def _fire(self, guild_id: int) -> None:
+        try:
+            await self.callback(guild_id)
+        except Exception:
+            log.exception("Birthday run for guild %s failed", guild_id)
+
+    async def run(self) -> None:
+        try:
+            while True:
+                self._wakeup.clear()
+                self._drop_stale()
+                if not self._heap:
+                    await self._wakeup.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                _, guild_id, _ = heapq.heappop(self._heap)
+                task = asyncio.create_task(self._fire(guild_id))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+        finally:
+            for task in self._running:
+                task.cancel()
@@ -0,0 +1,94 @@
+"""Bulk import and export of birthdays as CSV or JSON."""
+import csv
+import datetime
+import io
+import json
+from typing import Iterable, Iterator, Optional, Tuple
+
+FORMATS = ("csv", "json")
+
+
+def parse_birthday(text: str, today: datetime.date) -> Optional[list]:
+    """Parse a MM/DD, MM/DD/YYYY or YYYY-MM-DD birthday into ``[month, day, year]``.
+
+    Only these fixed layouts are accepted, which keeps this a few slices and
+    int() calls per row instead of a general date parser.
+    """
+    text = text.strip()
+    try:
+        if len(text) == 10 and text[4] == "-" and text[7] == "-":
+            year, month, day = int(text[0:4]), int(text[5:7]), int(text[8:10])
+        elif len(text) in (5, 10) and text[2] == "/" and (len(text) == 5 or text[5] == "/"):
+            month, day = int(text[0:2]), int(text[3:5])
+            year = int(text[6:10]) if len(text) == 10 else None
+        else:
+            return None
+        datetime.date(year or 2000, month, day)
+    except ValueError:
+        return None
+    if year is not None and not today.year - 110 <= year <= today.year:
+        return None
+    return [month, day, year]
+
+
+def format_birthday(birthday: list) -> str:
+    month, day, year = birthday
+    return f"{month:02}/{day:02}/{year:04}" if year else f"{month:02}/{day:02}"
+
+
+def _csv_rows(data: bytes) -> Iterator[Tuple[str, str]]:
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline=""))
+    for line, row in enumerate(reader):
+        if len(row) < 2:
+            continue
+        # an optional header line
+        if line == 0 and not row[0].strip().isdigit():
+            continue
+        yield row[0], row[1]
+
+
+def _json_rows(data: bytes) -> Iterator[Tuple[str, str]]:
+    # json has no incremental parser in the standard library, so the file is decoded at once
+    entries = json.loads(data)
+    if isinstance(entries, dict):
+        entries = [{"user_id": user_id, "birthday": birthday} for user_id, birthday in entries.items()]
+    if not isinstance(entries, list):
+        raise ValueError("Expected a list of birthdays")
+    for entry in entries:
+        if isinstance(entry, dict):
+            yield str(entry.get("user_id", "")), str(entry.get("birthday", ""))
+
+
+def read_birthdays(data: bytes, file_format: str) -> Iterator[Tuple[Optional[int], Optional[list]]]:
+    """Yield ``(user id, birthday)`` for each row, either being None if the row is invalid.
+
+    Raises ValueError if the file as a whole cannot be read.
+    """
+    today = datetime.datetime.utcnow().date()
+    rows = _json_rows(data) if file_format == "json" else _csv_rows(data)
+    try:
+        for user_id, birthday in rows:
+            user_id = user_id.strip()
+            yield int(user_id) if user_id.isdigit() else None, parse_birthday(birthday, today)
+    except (csv.Error, UnicodeDecodeError) as exc:
+        raise ValueError(str(exc)) from exc
+
+
+def write_birthdays(rows: Iterable[Tuple[int, list]], file_format: str) -> io.BytesIO:
+    """Write ``(user id, birthday)`` rows in the format ``read_birthdays`` reads, row by row."""
+    fp = io.BytesIO()
+    text = io.TextIOWrapper(fp, encoding="utf-8", newline="", write_through=True)
+    if file_format == "json":
+        text.write("[")
+        for index, (user_id, birthday) in enumerate(rows):
+            text.write(",\n" if index else "\n")
+            text.write(json.dumps({"user_id": user_id, "birthday": format_birthday(birthday)}))
+        text.write("\n]\n")
+    else:
+        writer = csv.writer(text)
+        writer.writerow(("user_id", "birthday"))
+        for user_id, birthday in rows:
+            writer.writerow((user_id, format_birthday(birthday)))
+    text.detach()
+    fp.seek(0)
+    return fp
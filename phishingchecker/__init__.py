@@ -1,5 +1,6 @@
 from .phishingchecker import PhishingChecker
 
-def setup(bot):
-    bot.add_cog(PhishingChecker(bot))
-    return bot
\ No newline at end of file
+async def setup(bot):
+    cog = PhishingChecker(bot)
+    await cog.initialize()
+    bot.add_cog(cog)
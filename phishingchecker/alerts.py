@@ -0,0 +1,79 @@
+"""Per-guild queue that coalesces phishing detections into batches."""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, NamedTuple
+
+import discord
+
+log = logging.getLogger("red.nyancogs.phishingchecker")
+
+
+class Detection(NamedTuple):
+    message: discord.Message
+    category: str
+    rule: str
+
+
+BatchHandler = Callable[[discord.Guild, List[Detection]], Awaitable[None]]
+
+
+class AlertPipeline:
+    """Queue detections per guild and hand them to ``handler`` in batches.
+
+    Each guild gets a bounded queue and a worker task, started on the first
+    detection. The worker waits up to ``window`` seconds after the first item
+    of a batch for more to arrive, so a raid is handled as a few batches
+    instead of one alert and action per message. When a queue is full the
+    oldest detection is dropped and counted.
+    """
+
+    def __init__(self, handler: BatchHandler, *, maxsize: int = 500, window: float = 1.5, max_batch: int = 100):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.window = window
+        self.max_batch = max_batch
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.dropped: Dict[int, int] = {}
+
+    def push(self, guild: discord.Guild, detection: Detection) -> None:
+        queue = self._queues.get(guild.id)
+        if queue is None:
+            queue = self._queues[guild.id] = asyncio.Queue(self.maxsize)
+            self._workers[guild.id] = asyncio.create_task(self._worker(guild, queue))
+        if queue.full():
+            queue.get_nowait()
+            self.dropped[guild.id] = self.dropped.get(guild.id, 0) + 1
+        queue.put_nowait(detection)
+
+    def depth(self, guild_id: int) -> int:
+        queue = self._queues.get(guild_id)
+        return queue.qsize() if queue is not None else 0
+
+    async def _next_batch(self, queue: asyncio.Queue) -> List[Detection]:
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self, guild: discord.Guild, queue: asyncio.Queue) -> None:
+        while True:
+            batch = await self._next_batch(queue)
+            try:
+                await self.handler(guild, batch)
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Error while handling phishing detections in guild %s", guild.id)
+
+    def stop(self) -> None:
+        for task in self._workers.values():
+            task.cancel()
+        self._workers.clear()
+        self._queues.clear()
@@ -0,0 +1,52 @@
+"""Bounded TTL/LRU cache of phishing verdicts."""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class VerdictCache:
+    """LRU cache whose entries expire after a TTL.
+
+    Positive verdicts (a rule matched) and negative verdicts (nothing matched)
+    have separate TTLs, so a clean link is re-checked sooner than a bad one is
+    forgotten. ``clear`` is called whenever the blocklists change.
+    """
+
+    def __init__(self, maxsize: int = 4096, positive_ttl: float = 3600, negative_ttl: float = 600):
+        self.maxsize = maxsize
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for ``key``, or ``default`` if absent or expired."""
+        entry = self._data.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, positive: bool) -> None:
+        ttl = self.positive_ttl if positive else self.negative_ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        total = self.hits + self.misses
+        return self.hits / total if total else None
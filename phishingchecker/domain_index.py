@@ -0,0 +1,279 @@
+"""Suffix index over blocklisted domains for the phishing checker."""
+import heapq
+import re
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+PHISHING = "Phishing"
+SUSPICIOUS = "Suspicious"
+# Not a feed category, given to hosts imitating a protected brand (see lookalike.py).
+LOOKALIKE = "Lookalike"
+
+# Lower rank wins when more than one rule matches the same URL.
+CATEGORY_RANK = {PHISHING: 0, SUSPICIOUS: 1, LOOKALIKE: 2}
+FEED_CATEGORIES = (PHISHING, SUSPICIOUS)
+CATEGORIES = tuple(sorted(CATEGORY_RANK, key=CATEGORY_RANK.get))
+
+# A host name written as plain text: dot separated labels ending in an alphabetic TLD,
+# not glued to surrounding word characters.
+BARE_DOMAIN_RE = re.compile(
+    r"(?<![\w.-])(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}(?![\w-])", re.IGNORECASE
+)
+
+
+class Verdict(NamedTuple):
+    """Result of a blocklist lookup."""
+
+    category: str
+    rule: str
+    host: str
+
+
+def split_url(url: str) -> Tuple[str, str]:
+    """Split a URL (with or without scheme) into a normalised host and path."""
+    url = url.strip()
+    if "://" not in url:
+        url = "http://" + url
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname or ""
+    except ValueError:
+        return "", ""
+    host = host.rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    return host, parts.path.rstrip("/")
+
+
+def normalize_rule(rule: str) -> str:
+    """Normalise a blocklist entry to ``host`` or ``host/path``, or "" if invalid."""
+    host, path = split_url(rule.lower())
+    if "." not in host:
+        return ""
+    return host + path
+
+
+def strongest(*verdicts: Optional[Verdict]) -> Optional[Verdict]:
+    """Return the highest ranked of ``verdicts``, ignoring ``None``."""
+    best = None
+    for verdict in verdicts:
+        if verdict is not None and (
+            best is None or CATEGORY_RANK[verdict.category] < CATEGORY_RANK[best.category]
+        ):
+            best = verdict
+    return best
+
+
+def find_domains(text: str) -> Iterator[str]:
+    """Yield every distinct host name mentioned in ``text``, in one pass over it."""
+    seen = set()
+    for match in BARE_DOMAIN_RE.finditer(text):
+        host = match.group(0).lower()
+        if host.startswith("www."):
+            host = host[4:]
+        if host not in seen:
+            seen.add(host)
+            yield host
+
+
+def host_suffixes(host: str) -> Iterator[str]:
+    """Yield ``host`` and each of its parent domains, most specific first."""
+    while host:
+        yield host
+        _, dot, host = host.partition(".")
+        if not dot:
+            return
+
+
+def _reverse_labels(host: str) -> Tuple[str, ...]:
+    return tuple(reversed(host.split(".")))
+
+
+def _ranked(rules: Iterable[str], rank: int) -> Iterator[Tuple[str, int]]:
+    for rule in rules:
+        yield rule, rank
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing."""
+
+    def __init__(self, expected: int, bits_per_entry: int = 10, hashes: int = 7):
+        self._size = max(64, expected * bits_per_entry)
+        self._bits = bytearray((self._size + 7) // 8)
+        self._hashes = hashes
+
+    def add(self, key: str) -> None:
+        digest = hash(key)
+        h1 = digest & 0xFFFFFFFF
+        h2 = ((digest >> 32) & 0xFFFFFFFF) | 1
+        for i in range(self._hashes):
+            pos = (h1 + i * h2) % self._size
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        # Same probe sequence as add(), bailing out at the first unset bit.
+        digest = hash(key)
+        h1 = digest & 0xFFFFFFFF
+        h2 = ((digest >> 32) & 0xFFFFFFFF) | 1
+        bits, size = self._bits, self._size
+        for i in range(self._hashes):
+            pos = (h1 + i * h2) % size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self._bits)
+
+
+class CompactHostSet:
+    """Sorted, immutable host -> category rank mapping packed into flat buffers.
+
+    Hosts are stored back to back in a single bytes blob with an ``array`` of
+    offsets, so an entry costs its length plus five bytes instead of a full
+    ``str`` object and dict slot. A Bloom filter in front answers most misses
+    without touching the sorted array; hits are confirmed with a binary search.
+    """
+
+    def __init__(self, blob: bytes, offsets: array, ranks: bytes, bloom: Optional[BloomFilter]):
+        self._blob = blob
+        self._offsets = offsets
+        self._ranks = ranks
+        self._bloom = bloom
+
+    def __len__(self) -> int:
+        return len(self._ranks)
+
+    def get(self, host: str) -> Optional[int]:
+        """Return the category rank stored for ``host``, or None."""
+        if self._bloom is not None and host not in self._bloom:
+            return None
+        key = host.encode()
+        blob, offsets = self._blob, self._offsets
+        lo, hi = 0, len(self._ranks)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = blob[offsets[mid] : offsets[mid + 1] - 1]
+            if entry < key:
+                lo = mid + 1
+            elif entry > key:
+                hi = mid
+            else:
+                return self._ranks[mid]
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        size = sys.getsizeof(self._blob) + sys.getsizeof(self._offsets) + sys.getsizeof(self._ranks)
+        if self._bloom is not None:
+            size += self._bloom.nbytes
+        return size
+
+
+class DomainIndex:
+    """Label-aware suffix index of blocklist rules.
+
+    Each rule is a host optionally followed by a path prefix, e.g. ``evil.com`` or
+    ``cdn.example.com/gift``. A rule for a host also covers every subdomain of it,
+    so a lookup costs one probe per label in the queried host. Host rules live in
+    a ``CompactHostSet``; the rare path rules are kept in a dict keyed on the
+    reversed host labels.
+    """
+
+    def __init__(self, hosts: Optional[CompactHostSet] = None, path_rules: Optional[dict] = None):
+        self._hosts = hosts
+        # reversed host labels -> [(path prefix, category, rule)]
+        self._path_rules: Dict[Tuple[str, ...], List[Tuple[str, str, str]]] = path_rules or {}
+
+    def __len__(self) -> int:
+        size = len(self._hosts) if self._hosts is not None else 0
+        return size + sum(len(bucket) for bucket in self._path_rules.values())
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate resident size of the index in bytes."""
+        size = self._hosts.nbytes if self._hosts is not None else 0
+        for key, bucket in self._path_rules.items():
+            size += sys.getsizeof(key) + sys.getsizeof(bucket)
+            size += sum(sys.getsizeof(entry[0]) + sys.getsizeof(entry[2]) for entry in bucket)
+        return size
+
+    @classmethod
+    def from_sorted(
+        cls, sources: Iterable[Tuple[str, Iterable[str]]], expected: int = 0, bloom: bool = True
+    ) -> "DomainIndex":
+        """Build an index by merging ``(category, rules)`` sources.
+
+        Every source must yield normalised rules (see ``normalize_rule``) in
+        sorted order; they are streamed, so only the compact result is kept in
+        memory. ``expected`` sizes the Bloom filter.
+        """
+        streams = [_ranked(rules, CATEGORY_RANK[category]) for category, rules in sources]
+        blob = bytearray()
+        offsets = array("I", [0])
+        ranks = bytearray()
+        filter_ = BloomFilter(expected) if bloom and expected else None
+        path_rules: Dict[Tuple[str, ...], List[Tuple[str, str, str]]] = {}
+        previous = None
+        # Equal rules come out of the merge strongest category first.
+        for rule, rank in heapq.merge(*streams):
+            if rule == previous:
+                continue
+            previous = rule
+            host, slash, path = rule.partition("/")
+            if slash:
+                path_rules.setdefault(_reverse_labels(host), []).append(
+                    ("/" + path, CATEGORIES[rank], rule)
+                )
+                continue
+            blob += rule.encode()
+            blob += b"\n"
+            offsets.append(len(blob))
+            ranks.append(rank)
+            if filter_ is not None:
+                filter_.add(rule)
+        return cls(CompactHostSet(bytes(blob), offsets, bytes(ranks), filter_), path_rules)
+
+    @classmethod
+    def from_lists(cls, lists: Mapping[str, Iterable[str]], bloom: bool = True) -> "DomainIndex":
+        """Compile ``{category: [rule, ...]}`` into a new index."""
+        sources = []
+        for category, rules in lists.items():
+            normalized = sorted({rule for rule in map(normalize_rule, rules) if rule})
+            sources.append((category, normalized))
+        return cls.from_sorted(sources, sum(len(rules) for _, rules in sources), bloom)
+
+    def path_sensitive(self, host: str) -> bool:
+        """Whether a verdict for ``host`` can depend on the URL path."""
+        if not self._path_rules:
+            return False
+        labels = _reverse_labels(host)
+        return any(labels[:depth] in self._path_rules for depth in range(1, len(labels) + 1))
+
+    def lookup(self, url: str) -> Optional[Verdict]:
+        """Return the strongest rule matching ``url``, or ``None``."""
+        return self.lookup_parts(*split_url(url))
+
+    def lookup_parts(self, host: str, path: str) -> Optional[Verdict]:
+        """Same as ``lookup`` for a URL already split with ``split_url``."""
+        if not host:
+            return None
+        best = None
+        if self._hosts is not None:
+            for suffix in host_suffixes(host):
+                rank = self._hosts.get(suffix)
+                if rank is not None:
+                    best = strongest(best, Verdict(CATEGORIES[rank], suffix, host))
+                    if rank == 0:
+                        return best
+        if self._path_rules:
+            path = path.lower()
+            labels = _reverse_labels(host)
+            for depth in range(1, len(labels) + 1):
+                for prefix, category, rule in self._path_rules.get(labels[:depth], ()):
+                    if path == prefix or path.startswith(prefix + "/"):
+                        best = strongest(best, Verdict(category, rule, host))
+        return best
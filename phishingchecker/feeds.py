@@ -0,0 +1,220 @@
+"""Blocklist feed fetching and on-disk snapshots for the phishing checker."""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+from redbot.core import __version__ as redbot_version
+
+from .domain_index import PHISHING, SUSPICIOUS, normalize_rule
+
+log = logging.getLogger("red.nyancogs.phishingchecker")
+
+user_agent = f"Red-DiscordBot/{redbot_version} PhishingChecker (https://github.com/Nanako0129/NyanCogs)"
+
+FEED_FORMATS = ("json", "hosts")
+# Addresses a hosts file points blocked names at.
+_HOSTS_SINKS = {"0.0.0.0", "127.0.0.1", "::", "::1"}
+
+
+class Feed(NamedTuple):
+    """A blocklist source.
+
+    ``source`` is an http(s) URL or a path to a local file. ``json`` feeds hold
+    either a list of domains or an object with a ``domains`` list; ``hosts``
+    feeds are hosts files or plain text with one domain per line.
+    """
+
+    name: str
+    source: str
+    category: str
+    format: str = "json"
+
+    @property
+    def is_local(self) -> bool:
+        return not self.source.startswith(("http://", "https://"))
+
+
+DEFAULT_FEEDS = (
+    Feed(
+        "domain-list",
+        "https://raw.githubusercontent.com/nikolaischunk/discord-phishing-links/main/domain-list.json",
+        PHISHING,
+    ),
+    Feed(
+        "suspicious-list",
+        "https://raw.githubusercontent.com/nikolaischunk/discord-phishing-links/main/suspicious-list.json",
+        SUSPICIOUS,
+    ),
+)
+
+
+def parse_feed(body: bytes, fmt: str) -> List[str]:
+    """Parse a feed body into a sorted list of unique normalised rules."""
+    if fmt == "json":
+        data = json.loads(body)
+        entries = data["domains"] if isinstance(data, dict) else data
+    else:
+        entries = []
+        for line in body.decode("utf-8", "replace").splitlines():
+            fields = line.split("#", 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) > 1 and fields[0] in _HOSTS_SINKS:
+                entries.extend(fields[1:])
+            else:
+                entries.append(fields[0])
+    return sorted({rule for rule in map(normalize_rule, entries) if rule})
+
+
+def estimate_size(rules: List[str]) -> int:
+    """Estimate the resident size of ``rules`` once compiled into a DomainIndex."""
+    # blob bytes + newline, 4 byte offset, 1 byte rank, 10 Bloom filter bits
+    return sum(len(rule.encode()) for rule in rules) + len(rules) * 7
+
+
+class FeedStore:
+    """Keeps the last good copy of every feed and refreshes them with conditional GETs.
+
+    Parsed entries are written to one sorted file per feed under ``path`` and
+    only their metadata stays in memory; the index is compiled by streaming
+    those files. A cold start is therefore protected before the first fetch.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, path: Path, timeout: float = 30):
+        self.session = session
+        self.path = path
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        # feed name -> {source, etag, last_modified, digest, entries, size}
+        self.states: Dict[str, dict] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def _state_path(self) -> Path:
+        return self.path / "state.json"
+
+    def _entries_path(self, name: str) -> Path:
+        return self.path / f"{name}.txt"
+
+    def load_snapshot(self) -> bool:
+        """Load the persisted feed state. Blocking, run it in an executor."""
+        try:
+            with open(self._state_path, encoding="utf-8") as fp:
+                self.states = json.load(fp)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError):
+            log.exception("Could not read the phishing feed snapshot, ignoring it")
+            return False
+        return True
+
+    def _write(self, path: Path, data: str) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            fp.write(data)
+        os.replace(tmp_path, path)
+
+    def _store(self, feed: Feed, rules: List[str], validators: dict) -> bool:
+        """Persist a freshly fetched feed. Returns True if its entries changed."""
+        data = "".join(rule + "\n" for rule in rules)
+        digest = hashlib.sha1(data.encode()).hexdigest()
+        previous = self.states.get(feed.name)
+        changed = previous is None or previous.get("digest") != digest or previous.get("source") != feed.source
+        if changed:
+            self._write(self._entries_path(feed.name), data)
+        self.states[feed.name] = {
+            "source": feed.source,
+            "digest": digest,
+            "entries": len(rules),
+            "size": estimate_size(rules),
+            **validators,
+        }
+        self._write(self._state_path, json.dumps(self.states))
+        return changed
+
+    def _read_local(self, feed: Feed, state: Optional[dict]) -> Optional[Tuple[List[str], dict]]:
+        stat = os.stat(feed.source)
+        validators = {"mtime": stat.st_mtime, "file_size": stat.st_size}
+        if state and all(state.get(key) == value for key, value in validators.items()):
+            return None
+        with open(feed.source, "rb") as fp:
+            return parse_feed(fp.read(), feed.format), validators
+
+    async def _fetch(self, feed: Feed) -> Optional[Tuple[List[str], dict]]:
+        """Fetch and parse one feed. Returns None if it is unchanged since the last fetch."""
+        loop = asyncio.get_running_loop()
+        state = self.states.get(feed.name)
+        if state and state.get("source") != feed.source:
+            state = None
+        if feed.is_local:
+            return await loop.run_in_executor(None, self._read_local, feed, state)
+        headers = {"user-agent": user_agent}
+        if state:
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
+        async with self.session.get(feed.source, headers=headers, timeout=self.timeout) as resp:
+            if resp.status == 304:
+                return None
+            resp.raise_for_status()
+            body = await resp.read()
+            validators = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+            }
+        rules = await loop.run_in_executor(None, parse_feed, body, feed.format)
+        return rules, validators
+
+    async def refresh(self, feeds: List[Feed]) -> bool:
+        """Refresh every feed. Returns True if any of them changed.
+
+        A feed that fails to download keeps its previous entries.
+        """
+        async with self._lock:
+            results = await asyncio.gather(*(self._fetch(feed) for feed in feeds), return_exceptions=True)
+            changed = False
+            loop = asyncio.get_running_loop()
+            for feed, result in zip(feeds, results):
+                if isinstance(result, Exception):
+                    log.warning("Could not update phishing feed %s: %r", feed.name, result)
+                elif result is not None:
+                    changed |= await loop.run_in_executor(None, self._store, feed, *result)
+            return changed
+
+    def _iter_rules(self, name: str) -> Iterator[str]:
+        try:
+            with open(self._entries_path(name), encoding="utf-8") as fp:
+                for line in fp:
+                    yield line.rstrip("\n")
+        except FileNotFoundError:
+            return
+
+    def sources(self, feeds: List[Feed]) -> List[Tuple[str, Iterator[str]]]:
+        """Return ``(category, sorted rules)`` streams for ``DomainIndex.from_sorted``."""
+        return [
+            (feed.category, self._iter_rules(feed.name))
+            for feed in feeds
+            if self.states.get(feed.name, {}).get("source") == feed.source
+        ]
+
+    def expected_entries(self, feeds: List[Feed]) -> int:
+        return sum(self.states.get(feed.name, {}).get("entries", 0) for feed in feeds)
+
+    def _remove(self, name: str) -> None:
+        self.states.pop(name, None)
+        try:
+            self._entries_path(name).unlink()
+        except FileNotFoundError:
+            pass
+        self._write(self._state_path, json.dumps(self.states))
+
+    async def remove(self, name: str) -> None:
+        """Forget a feed and delete its snapshot."""
+        async with self._lock:
+            await asyncio.get_running_loop().run_in_executor(None, self._remove, name)
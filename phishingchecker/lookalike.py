@@ -0,0 +1,182 @@
+"""Detection of hosts imitating protected brand domains."""
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .domain_index import LOOKALIKE, Verdict, host_suffixes
+
+# Brand name -> the domains that legitimately carry it.
+PROTECTED_BRANDS = {
+    "discord": ("discord.com", "discord.gg", "discord.gift", "discord.media", "discord.new", "discord.co"),
+    "discordapp": ("discordapp.com", "discordapp.net"),
+    "discordstatus": ("discordstatus.com",),
+    "steamcommunity": ("steamcommunity.com",),
+    "steampowered": ("steampowered.com",),
+    "epicgames": ("epicgames.com",),
+    "roblox": ("roblox.com",),
+    "paypal": ("paypal.com", "paypal.me"),
+    "twitch": ("twitch.tv",),
+    "minecraft": ("minecraft.net",),
+}
+
+# Real sites whose names carry or resemble a brand, never reported as lookalikes.
+ALLOWED_HOSTS = (
+    "discord.bio",
+    "discord.js.org",
+    "discord.me",
+    "discordjs.guide",
+    "discordpy.dev",
+    "discordpy.readthedocs.io",
+    "discords.com",
+    "discordia.com",
+    "twitchy.com",
+    "minecraft.wiki",
+)
+
+# Second level labels under which country code TLDs register names, as in example.co.uk.
+SECOND_LEVEL_SUFFIXES = frozenset({"ac", "co", "com", "edu", "gov", "net", "or", "org"})
+
+# Words scam domains glue to a brand name, as in discordnitro or steam-gift.
+LURE_WORDS = (
+    "airdrop", "claim", "drop", "free", "gift", "gifts", "giveaway", "login", "nitro",
+    "offer", "promo", "reward", "rewards", "trade", "verify",
+)
+
+# Characters commonly swapped in for one another, folded to one representative.
+_CONFUSABLE_CHARS = str.maketrans(
+    {
+        "0": "o", "1": "l", "i": "l", "|": "l", "!": "l", "3": "e", "4": "a", "@": "a",
+        "5": "s", "$": "s", "7": "t", "8": "b", "9": "g",
+        # Cyrillic and Greek letters that render like Latin ones
+        "а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "у": "y", "х": "x", "і": "l",
+        "ј": "j", "ѕ": "s", "ԁ": "d", "ɡ": "g", "к": "k", "м": "m", "т": "t", "в": "b",
+        "ο": "o", "α": "a", "ι": "l", "ν": "v", "κ": "k", "τ": "t", "ρ": "p",
+    }
+)
+_CONFUSABLE_PAIRS = (("rn", "m"), ("vv", "w"), ("cl", "d"))
+
+# Tokens shorter than this are too short to judge reliably.
+MIN_TOKEN_LENGTH = 5
+
+
+def _decode_label(label: str) -> str:
+    if label.startswith("xn--"):
+        try:
+            return label[4:].encode("ascii").decode("punycode")
+        except (UnicodeError, ValueError):
+            return label
+    return label
+
+
+def skeleton(text: str) -> str:
+    """Fold ``text`` so that visually confusable spellings compare equal."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = text.translate(_CONFUSABLE_CHARS)
+    for pair, replacement in _CONFUSABLE_PAIRS:
+        text = text.replace(pair, replacement)
+    return text
+
+
+def registrable_label(host: str) -> Optional[str]:
+    """The label left of the public suffix, the part of ``host`` its owner registered.
+
+    Only the common ``<label>.<cc>`` second level suffixes are known, not the
+    whole public suffix list.
+    """
+    labels = host.split(".")
+    if len(labels) < 2:
+        return None
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_SUFFIXES:
+        return labels[-3]
+    return labels[-2]
+
+
+def bigrams(text: str) -> Set[str]:
+    padded = f"^{text}$"
+    return {padded[i : i + 2] for i in range(len(padded) - 1)}
+
+
+class LookalikeIndex:
+    """Bigram index over the skeletons of protected brand names.
+
+    A host outside the brand's own domains and ``allowed`` is a lookalike
+    when one of the tokens of its registrable label has the same skeleton as a brand (the brand
+    itself or a homoglyph swap), is a brand glued to a lure word such as
+    "nitro", or its skeleton's bigram Dice similarity with a brand reaches
+    ``threshold`` (a typo). Only brands sharing a bigram with the token are
+    scored, so a query costs a few dict probes however many brands are
+    protected. Subdomain labels are not judged: anyone can name a subdomain
+    of their site after a brand, like roblox.fandom.com, without imitating it.
+    """
+
+    def __init__(
+        self,
+        brands: Dict[str, Iterable[str]] = PROTECTED_BRANDS,
+        threshold: float = 0.75,
+        allowed: Iterable[str] = ALLOWED_HOSTS,
+        lures: Iterable[str] = LURE_WORDS,
+    ):
+        self.threshold = threshold
+        self._brands: List[Tuple[str, str, Set[str]]] = []
+        self._skeletons: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = {}
+        self._legit: Set[str] = set(allowed)
+        self._lures: Set[str] = {skeleton(word) for word in lures}
+        for brand, domains in brands.items():
+            brand_id = len(self._brands)
+            sk = skeleton(brand)
+            grams = bigrams(sk)
+            self._brands.append((brand, domains[0], grams))
+            self._skeletons[sk] = brand_id
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(brand_id)
+            self._legit.update(domains)
+
+    def _tokens(self, host: str) -> Set[str]:
+        label = registrable_label(host)
+        if label is None:
+            return set()
+        label = _decode_label(label)
+        tokens = {label.replace("-", ""), *label.split("-")}
+        return {token for token in tokens if len(token) >= MIN_TOKEN_LENGTH}
+
+    def _score(self, token: str) -> Optional[Tuple[float, int]]:
+        sk = skeleton(token)
+        brand_id = self._skeletons.get(sk)
+        if brand_id is None:
+            brand_id = self._lured_brand(sk)
+        if brand_id is not None:
+            # match() has already let the brand's own domains through.
+            return 1.0, brand_id
+        grams = bigrams(sk)
+        shared = Counter(brand_id for gram in grams for brand_id in self._postings.get(gram, ()))
+        best = None
+        for brand_id, count in shared.items():
+            score = 2 * count / (len(grams) + len(self._brands[brand_id][2]))
+            if score >= self.threshold and (best is None or score > best[0]):
+                best = (score, brand_id)
+        return best
+
+    def _lured_brand(self, sk: str) -> Optional[int]:
+        """The brand a skeleton is made of, with a lure word before or after it."""
+        for split in range(1, len(sk)):
+            head, tail = sk[:split], sk[split:]
+            if head in self._skeletons and tail in self._lures:
+                return self._skeletons[head]
+            if tail in self._skeletons and head in self._lures:
+                return self._skeletons[tail]
+        return None
+
+    def match(self, host: str) -> Optional[Verdict]:
+        """Return a lookalike verdict for ``host``, or None."""
+        if not self.threshold or any(suffix in self._legit for suffix in host_suffixes(host)):
+            return None
+        best = None
+        for token in self._tokens(host):
+            scored = self._score(token)
+            if scored is not None and (best is None or scored[0] > best[0]):
+                best = scored
+        if best is None:
+            return None
+        return Verdict(LOOKALIKE, self._brands[best[1]][1], host)
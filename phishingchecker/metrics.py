@@ -0,0 +1,91 @@
+"""Lightweight counters and latency histograms for the phishing checker."""
+import logging
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional
+
+# Stage timings are also emitted here at DEBUG level, with the stage name and
+# duration in the record's ``extra``, for anyone who wants to ship them elsewhere.
+metrics_log = logging.getLogger("red.nyancogs.phishingchecker.metrics")
+
+# Bucket upper bounds in seconds, from 10 microseconds to 30 seconds.
+BUCKET_BOUNDS = (
+    1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2,
+    2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; observing a value is a bisect and an increment."""
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets: List[int] = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q`` quantile (0-1)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics: "Metrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """Counters and per-stage latency histograms."""
+
+    def __init__(self):
+        self.counters: Counter = Counter()
+        self.histograms: Dict[str, Histogram] = {}
+        self.since = time.time()
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += amount
+
+    def observe(self, stage: str, seconds: float) -> None:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(seconds)
+        if metrics_log.isEnabledFor(logging.DEBUG):
+            metrics_log.debug("%s took %.6fs", stage, seconds, extra={"stage": stage, "seconds": seconds})
+
+    def time(self, stage: str) -> _Timer:
+        """Context manager recording how long its block took under ``stage``."""
+        return _Timer(self, stage)
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
+        self.since = time.time()
@@ -1,64 +1,300 @@
-import requests
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Dict, Iterable, List, Optional, Set, Tuple
+
+import aiohttp
 import discord
-from unshortenit import UnshortenIt
 
 from discord.ext import tasks
 
 from redbot.core import Config, commands, modlog
+from redbot.core.data_manager import cog_data_path
 from redbot.core.utils import chat_formatting as cf
 from redbot.core.utils.common_filters import URL_RE
 
-phishing_domain_list_url = "https://raw.githubusercontent.com/nikolaischunk/discord-phishing-links/main/domain-list.json"
-suspicious_list_url = "https://raw.githubusercontent.com/nikolaischunk/discord-phishing-links/main/suspicious-list.json"
+from .alerts import AlertPipeline, Detection
+from .cache import VerdictCache
+from .domain_index import (
+    CATEGORY_RANK,
+    FEED_CATEGORIES,
+    LOOKALIKE,
+    PHISHING,
+    DomainIndex,
+    Verdict,
+    find_domains,
+    host_suffixes,
+    split_url,
+    strongest,
+)
+from .feeds import DEFAULT_FEEDS, FEED_FORMATS, Feed, FeedStore
+from .lookalike import LookalikeIndex
+from .metrics import Metrics
+from .raid import RaidDetector
+from .scanner import HistoryScan, new_scan_state
+from .resolver import RedirectResolver, public_session
+
+log = logging.getLogger("red.nyancogs.phishingchecker")
+
+# Per message, at most this many URLs are resolved at the same time.
+MAX_CONCURRENT_URLS = 5
+# Per batch of detections, at most this many deletes, cases and alerts run at the same time.
+MAX_CONCURRENT_ACTIONS = 5
+# Discord only bulk deletes messages younger than 14 days, at most 100 per call.
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+BULK_DELETE_LIMIT = 100
+
+DEFAULT_TRUSTED_HOSTS = [
+    "discord.com",
+    "discord.gg",
+    "discord.media",
+    "discordapp.com",
+    "discordapp.net",
+    "giphy.com",
+    "github.com",
+    "tenor.com",
+    "twitch.tv",
+    "youtu.be",
+    "youtube.com",
+]
+
+FEED_NAME_RE = re.compile(r"^[a-z0-9_-]{1,32}$")
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f}us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds:.2f}s"
+
 
 class PhishingChecker(commands.Cog):
-    
+
+    default_guild_settings = {
+        "enabled": False,
+        "send_channel": None,
+        "action": None,
+        "always_delete": False,
+        "raid_threshold": 5,
+        "scan": None,
+    }
+
     def __init__(self, bot):
         self.bot = bot
         self.config = Config.get_conf(self, identifier=360791024465771322503262, force_registration=True)
-        default_guild = {
-            "enabled": False,
-            "send_channel": None,
-            "action": None,
-            "always_delete": False,
-        }
-        self.config.register_guild(**default_guild)
+        self.config.register_guild(**self.default_guild_settings)
+        self.config.register_global(
+            trusted_hosts=DEFAULT_TRUSTED_HOSTS,
+            feeds=[feed._asdict() for feed in DEFAULT_FEEDS],
+            lookalike_threshold=0.75,
+            lookalike_actions=False,
+        )
+        self.feed_list: List[Feed] = list(DEFAULT_FEEDS)
+        self.trusted_hosts: Set[str] = set(DEFAULT_TRUSTED_HOSTS)
+        # guild id -> settings, mirrors Config so on_message never has to await it
+        self.guild_settings: Dict[int, dict] = {}
+        self.domain_index = DomainIndex()
+        self.session = aiohttp.ClientSession()
+        self.feeds = FeedStore(self.session, cog_data_path(self) / "feeds")
+        self._refresh_lock = asyncio.Lock()
+        self.metrics = Metrics()
+        # links posted in chat get their own session, which refuses internal addresses
+        self.resolver = RedirectResolver(public_session(), metrics=self.metrics)
+        self.verdict_cache = VerdictCache()
+        self.lookalikes = LookalikeIndex()
+        # Lookalikes are a heuristic, so by default they are only alerted on.
+        self.lookalike_actions = False
+        self.alerts = AlertPipeline(self.process_detections)
+        self.raids = RaidDetector()
+        self._raid_watchers: Dict[int, asyncio.Task] = {}
+        self._scans: Dict[int, HistoryScan] = {}
+
+    async def initialize(self):
+        self.guild_settings = await self.config.all_guilds()
+        self.trusted_hosts = set(await self.config.trusted_hosts())
+        self.feed_list = [Feed(**feed) for feed in await self.config.feeds()]
+        self.lookalikes.threshold = await self.config.lookalike_threshold()
+        self.lookalike_actions = await self.config.lookalike_actions()
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, self.feeds.load_snapshot):
+            await self.compile_checking_list()
         self.update_checking_list.start()
+        if any(settings.get("scan") for settings in self.guild_settings.values()):
+            asyncio.create_task(self.resume_scans())
 
     def cog_unload(self):
         self.update_checking_list.cancel()
+        self.alerts.stop()
+        for task in self._raid_watchers.values():
+            task.cancel()
+        for scan in self._scans.values():
+            scan.task.cancel()
+        asyncio.create_task(self.session.close())
+        asyncio.create_task(self.resolver.session.close())
+
+    async def compile_checking_list(self) -> None:
+        # Streams the per-feed snapshots from disk, so build it off the event loop.
+        index = await asyncio.get_running_loop().run_in_executor(
+            None,
+            DomainIndex.from_sorted,
+            self.feeds.sources(self.feed_list),
+            self.feeds.expected_entries(self.feed_list),
+        )
+        # Swap in the new index in one step, lookups never see a half-built list.
+        self.domain_index = index
+        self.verdict_cache.clear()
+
+    def get_guild_settings(self, guild: discord.Guild) -> dict:
+        return self.guild_settings.get(guild.id, self.default_guild_settings)
+
+    async def set_guild_setting(self, guild: discord.Guild, key: str, value) -> None:
+        """Write a guild setting to Config and to the in-memory copy."""
+        await self.config.guild(guild).set_raw(key, value=value)
+        self.guild_settings.setdefault(guild.id, dict(self.default_guild_settings))[key] = value
+
+    async def refresh_checking_list(self) -> bool:
+        async with self._refresh_lock:
+            changed = await self.feeds.refresh(self.feed_list)
+            if changed:
+                await self.compile_checking_list()
+        return changed
 
     @tasks.loop(seconds=1800)
     async def update_checking_list(self) -> None:
+        # an exception escaping the body would stop the loop for good
         try:
-            self.phishing_domain_list = requests.get(phishing_domain_list_url).json()
-            self.suspicious_list = requests.get(suspicious_list_url).json()
+            await self.refresh_checking_list()
         except Exception:
-            pass
+            log.exception("Could not refresh the phishing feeds")
     
+    def is_trusted(self, host: str) -> bool:
+        return any(suffix in self.trusted_hosts for suffix in host_suffixes(host))
+
     async def check_phishing_info(self, url: str):
-        unshortener = UnshortenIt(default_timeout=10)
-        try: 
-            _url = unshortener.unshorten(url, unshorten_nested=True)
-        except Exception:
-            try:
-                _url = requests.get(url, allow_redirects=False).headers['location']
-            except Exception:
-                _url = url
-        url = _url
-        if url.startswith("https://"):
-            url = url[8:]
-        elif url.startswith("http://"):
-            url = url[7:]
-        if url.startswith("www."):
-            url = url[4:]
-        if url.endswith("/"):
-            url = url[:-1]
-        if url in self.phishing_domain_list["domains"]:
-            return True, "Phishing", url
-        if url in self.suspicious_list["domains"]:
-            return True, "Suspicious", url
-        return False, "", url
+        host, _ = split_url(url)
+        if self.is_trusted(host):
+            return False, "", url
+        cached = self.verdict_cache.get(("url", url))
+        if cached is not None:
+            return cached
+        if self.resolver.is_shortener(host):
+            with self.metrics.time("resolve"):
+                chain, complete = await self.resolver.resolve(url)
+        else:
+            # Ordinary links do not redirect anywhere worth following, skip the network.
+            chain, complete = [url], True
+        with self.metrics.time("lookup"):
+            verdict = strongest(*(self.lookup_url(hop) for hop in chain))
+        if verdict is None:
+            result = False, "", chain[-1]
+        elif verdict.category == LOOKALIKE:
+            # the rule is the genuine brand domain, alerts and reasons must name the imitation
+            result = True, verdict.category, f"{verdict.host} (imitates {verdict.rule})"
+        else:
+            result = True, verdict.category, verdict.rule
+        # a clean verdict on a chain cut short by a timeout or error says nothing about where it leads
+        if result[0] or complete:
+            self.verdict_cache.set(("url", url), result, positive=result[0])
+        return result
+
+    async def scan_content(self, content: str, live: bool = True) -> Optional[Tuple[bool, str, str]]:
+        """Check every link and bare domain mention in a message's content.
+
+        Bare mentions only need index lookups, so they are checked first and a
+        phishing hit among them skips resolving the links altogether. Pass
+        ``live=False`` for old messages, so they do not count in the live stats.
+        """
+        with self.metrics.time("extract"):
+            urls = [match.group(0) for match in URL_RE.finditer(content)]
+            hosts = list(find_domains(content))
+        if live:
+            self.metrics.incr("urls_seen", len(urls))
+            self.metrics.incr("domains_seen", len(hosts))
+        mention = self.scan_bare_domains(hosts)
+        if mention is not None and mention[1] == PHISHING:
+            return mention
+        result = await self.scan_urls(urls)
+        if result is None or (mention is not None and CATEGORY_RANK[mention[1]] < CATEGORY_RANK[result[1]]):
+            return mention
+        return result
+
+    def scan_bare_domains(self, hosts: Iterable[str]) -> Optional[Tuple[bool, str, str]]:
+        """Check host names written without a scheme, like ``evil.com``.
+
+        Only the feeds are consulted: ordinary text is full of ``word.word``
+        tokens, like file names, that the lookalike heuristic would misjudge.
+        """
+        best = None
+        with self.metrics.time("lookup"):
+            for host in hosts:
+                if self.is_trusted(host):
+                    continue
+                best = strongest(best, self.domain_index.lookup_parts(host, ""))
+                if best is not None and best.category == PHISHING:
+                    break
+        if best is None:
+            return None
+        return True, best.category, best.rule
+
+    async def scan_urls(self, urls: Iterable[str]) -> Optional[Tuple[bool, str, str]]:
+        """Check ``urls`` concurrently and return the strongest hit, or None.
+
+        Duplicate URLs are checked once, and the remaining checks are cancelled
+        as soon as one URL is a phishing hit.
+        """
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return None
+        if len(urls) == 1:
+            result = await self.check_phishing_info(urls[0])
+            return result if result[0] else None
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_URLS)
+
+        async def check(url: str) -> Tuple[bool, str, str]:
+            async with semaphore:
+                return await self.check_phishing_info(url)
+
+        tasks = [asyncio.ensure_future(check(url)) for url in urls]
+        best = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if not result[0]:
+                    continue
+                if best is None or CATEGORY_RANK[result[1]] < CATEGORY_RANK[best[1]]:
+                    best = result
+                if result[1] == PHISHING:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+        return best
+
+    def lookup_url(self, url: str) -> Optional[Verdict]:
+        """Look up a resolved URL, sharing verdicts between URLs on the same host."""
+        host, path = split_url(url)
+        key = ("host", host)
+        cached = self.verdict_cache.get(key)
+        if cached is not None:
+            return cached or None
+        verdict = self.domain_index.lookup_parts(host, path)
+        if verdict is None:
+            # Not listed yet, but it may be a fresh typosquat of a protected brand.
+            verdict = self.lookalikes.match(host)
+        if not self.domain_index.path_sensitive(host):
+            self.verdict_cache.set(key, verdict or False, positive=verdict is not None)
+        return verdict
 
     async def send_phishing_warn_embed(
             self,
@@ -92,34 +328,169 @@ class PhishingChecker(commands.Cog):
             return
         if message.author.bot:
             return
-        if not await self.config.guild(message.guild).get_raw("enabled"):
-            return
-        alaways_delete = await self.config.guild(message.guild).get_raw("always_delete")
-        action = await self.config.guild(message.guild).get_raw("action")
-        channel_id = await self.config.guild(message.guild).get_raw("send_channel")
-        for match in URL_RE.finditer(message.content):
-            url = match.group(0)
-            is_phishing, phishing_type, match_domain = await self.check_phishing_info(url)
-            if is_phishing:
-                if channel_id != 0:
-                    await self.send_phishing_warn_embed(
-                        message=message,
-                        origin_content=message.content,
-                        domain=match_domain,
-                        phishing_type=phishing_type,
+        settings = self.get_guild_settings(message.guild)
+        if not settings["enabled"]:
+            return
+        self.metrics.incr("messages_scanned")
+        result = await self.scan_content(message.content)
+        if result is None:
+            return
+        _, phishing_type, match_domain = result
+        self.metrics.incr(f"hits_{phishing_type.lower()}")
+        # lookalikes are not acted on by default, so they must not switch on raid mode's deletes either
+        raid_hit = self.lookalike_actions or phishing_type != LOOKALIKE
+        if raid_hit and self.raids.record(message.guild.id, match_domain, settings["raid_threshold"]):
+            self.start_raid_mode(message.guild, match_domain)
+        self.alerts.push(message.guild, Detection(message, phishing_type, match_domain))
+
+    def start_raid_mode(self, guild: discord.Guild, domain: str) -> None:
+        log.info("Phishing raid detected in guild %s (%s)", guild.id, domain)
+        self._raid_watchers[guild.id] = asyncio.create_task(self._watch_raid(guild, domain))
+
+    async def _watch_raid(self, guild: discord.Guild, domain: str) -> None:
+        channel_id = self.get_guild_settings(guild)["send_channel"]
+        await self.send_raid_notice(
+            channel_id,
+            f"Raid mode enabled: {cf.inline(domain)} is being posted by many messages at once. "
+            "Phishing messages will be bulk deleted until it calms down.",
+        )
+        try:
+            while True:
+                await asyncio.sleep(self.raids.window)
+                threshold = self.get_guild_settings(guild)["raid_threshold"]
+                if self.raids.check_ended(guild.id, threshold):
+                    break
+        finally:
+            self._raid_watchers.pop(guild.id, None)
+        log.info("Phishing raid in guild %s ended", guild.id)
+        await self.send_raid_notice(channel_id, "Raid mode ended, the phishing rate fell back to normal.")
+
+    async def send_raid_notice(self, channel_id, text: str) -> None:
+        channel = self.bot.get_channel(int(channel_id)) if channel_id else None
+        if channel is None:
+            return
+        embed = discord.Embed(color=await self.bot.get_embed_color(self))
+        embed.title = "🔎🔗 • Phishing checker"
+        embed.description = text
+        try:
+            await channel.send(embed=embed)
+        except discord.HTTPException:
+            pass
+
+    @staticmethod
+    def delete_jobs(messages: Iterable[discord.Message]) -> List[Awaitable]:
+        """Return coroutines deleting ``messages`` with as few API calls as possible.
+
+        Messages are grouped per channel and removed with bulk deletes of up to
+        100 messages; messages too old for a bulk delete are deleted one by one.
+        """
+        bulk_cutoff = datetime.utcnow() - BULK_DELETE_MAX_AGE
+        by_channel: Dict[int, Dict[int, discord.Message]] = {}
+        jobs = []
+        for message in messages:
+            if message.created_at < bulk_cutoff:
+                jobs.append(message.delete())
+            else:
+                by_channel.setdefault(message.channel.id, {})[message.id] = message
+        for channel_messages in by_channel.values():
+            channel_messages = list(channel_messages.values())
+            channel = channel_messages[0].channel
+            for i in range(0, len(channel_messages), BULK_DELETE_LIMIT):
+                chunk = channel_messages[i : i + BULK_DELETE_LIMIT]
+                if len(chunk) == 1:
+                    jobs.append(chunk[0].delete())
+                else:
+                    jobs.append(channel.delete_messages(chunk))
+        return jobs
+
+    async def punish(self, guild: discord.Guild, action: str, member: discord.Member, rule: str) -> None:
+        """Ban or kick ``member``, then record the modlog case."""
+        reason = f"Phishing link detected: {rule}"
+        if action == "ban":
+            await guild.ban(member, reason=reason, delete_message_days=0)
+        else:
+            await guild.kick(member, reason=reason)
+        await modlog.case_create(
+            self.bot, guild, datetime.now(timezone.utc), action, member, moderator=guild.me, reason=reason
+        )
+
+    async def process_detections(self, guild: discord.Guild, detections: List[Detection]) -> None:
+        """Alert and act on a batch of detections from one guild."""
+        settings = self.get_guild_settings(guild)
+        action = settings["action"]
+        channel_id = settings["send_channel"]
+        raid_mode = guild.id in self.raids.active
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_ACTIONS)
+
+        async def bounded(stage: str, coro):
+            async with semaphore:
+                try:
+                    with self.metrics.time(stage):
+                        await coro
+                except discord.HTTPException as exc:
+                    log.warning("Phishing checker action failed in guild %s: %r", guild.id, exc)
+                except Exception:  # pylint: disable=broad-except
+                    log.exception("Phishing checker action failed in guild %s", guild.id)
+
+        # Only alert on lookalikes unless the owner allowed acting on them.
+        actionable = [
+            detection for detection in detections
+            if self.lookalike_actions or detection.category != LOOKALIKE
+        ]
+        jobs = []
+        if action in ("ban", "kick"):
+            # One case per author, however many messages they sent in this batch.
+            authors = {}
+            for detection in actionable:
+                authors.setdefault(detection.message.author.id, detection)
+            for detection in authors.values():
+                jobs.append(("action", self.punish(guild, action, detection.message.author, detection.rule)))
+        if raid_mode or action == "delete" or settings["always_delete"]:
+            for job in self.delete_jobs(detection.message for detection in actionable):
+                jobs.append(("action", job))
+        if channel_id:
+            groups: Dict[str, List[Detection]] = {}
+            for detection in detections:
+                groups.setdefault(detection.rule, []).append(detection)
+            for group in groups.values():
+                group_action = action if self.lookalike_actions or group[0].category != LOOKALIKE else None
+                if len(group) == 1 and not raid_mode:
+                    jobs.append(("alert", self.send_phishing_warn_embed(
+                        message=group[0].message,
+                        origin_content=group[0].message.content,
+                        domain=group[0].rule,
+                        phishing_type=group[0].category,
                         channel=channel_id,
-                        what_action=action
-                    )
-                if action == "ban":
-                    case = await modlog.case_create(
-                        self.bot, message.guild, action_type="ban",
-                        user=message.author, moderator=self.bot, reason=f"Phishing link detected: {match_domain}")
-                elif action == "kick":
-                    case = await modlog.case_create(
-                        self.bot, message.guild, action_type="kick",
-                        user=message.author, moderator=self.bot, reason=f"Phishing link detected: {match_domain}")
-                elif action == "delete" or alaways_delete:
-                    await message.delete()
+                        what_action=group_action
+                    )))
+                else:
+                    jobs.append(("alert", self.send_phishing_summary_embed(group, channel_id, group_action)))
+        await asyncio.gather(*(bounded(stage, job) for stage, job in jobs))
+
+    async def send_phishing_summary_embed(self, detections: List[Detection], channel, what_action):
+        authors: Dict[int, List[discord.Message]] = {}
+        for detection in detections:
+            authors.setdefault(detection.message.author.id, []).append(detection.message)
+        channels = {detection.message.channel.mention for detection in detections}
+        embed = discord.Embed(color=await self.bot.get_embed_color(self))
+        embed.title = "🔎🔗 • Phishing checker"
+        embed.description = (
+            f"Phishing burst detected!\n {len(detections)} messages from {len(authors)} users contained "
+            f"{cf.bold(detections[0].category)} link in our checking list."
+        )
+        lines = [
+            f"`{messages[0].author}` (`{user_id}`): {len(messages)} message(s)"
+            for user_id, messages in authors.items()
+        ]
+        users = "\n".join(lines)
+        if len(users) > 1024:
+            users = users[:1000].rsplit("\n", 1)[0] + "\n..."
+        embed.add_field(name="Users", value=users, inline=False)
+        embed.add_field(name="Channels", value=cf.humanize_list(sorted(channels))[:1024], inline=False)
+        embed.add_field(name="Detected domain", value=f"{cf.box(detections[0].rule, lang='fix')}", inline=False)
+        embed.add_field(name="Action", value="{}".format(cf.box(what_action)), inline=False)
+        embed.set_footer(text=f"To disable these notifications, use {cf.inline('[p]phck setch')}")
+        await self.bot.get_channel(int(channel)).send(embed=embed)
 
     @commands.guild_only()
     @commands.has_permissions(manage_guild=True)
@@ -131,64 +502,218 @@ class PhishingChecker(commands.Cog):
     @phishingchecker.command()
     async def enable(self, ctx: commands.Context, on_off: bool):
         """Enable the phishing checker"""
+        enabled = self.get_guild_settings(ctx.guild)["enabled"]
         if on_off:
-            if await self.config.guild(ctx.guild).get_raw("enabled") is True:
+            if enabled is True:
                 await ctx.send("Phishing checker is already enabled.")
                 return
-            await self.config.guild(ctx.guild).enabled.set(True)
+            await self.set_guild_setting(ctx.guild, "enabled", True)
             await ctx.send("Phishing checker enabled")
         else:
-            if await self.config.guild(ctx.guild).get_raw("enabled") is False:
+            if enabled is False:
                 await ctx.send("Phishing checker is already disabled.")
                 return
-            await self.config.guild(ctx.guild).enabled.set(False)
+            await self.set_guild_setting(ctx.guild, "enabled", False)
             await ctx.send("Phishing checker disabled")
 
     @phishingchecker.command(name="setchannel", aliases=["setch"])
     async def set_send_channel(self, ctx: commands.Context, channel: discord.TextChannel = None):
         """Set the channel to send the phishing checker logs. Leave it blank to disable it."""
         if channel is None:
-            await self.config.guild(ctx.guild).send_channel.set(None)
+            await self.set_guild_setting(ctx.guild, "send_channel", None)
             await ctx.send("Phishing checker logs will not be sent to any channel.")
             return
-        await self.config.guild(ctx.guild).set_raw("send_channel", value=str(channel.id))
+        await self.set_guild_setting(ctx.guild, "send_channel", str(channel.id))
         await ctx.send(f"Phishing checker logs will be sent to {channel.mention}")
 
     @phishingchecker.command(name="update", aliases=["up"])
-    async def force_update_list(self):
+    async def force_update_list(self, ctx: commands.Context):
         """Force update the checking list"""
-        try:
-            self.phishing_domain_list = requests.get(phishing_domain_list_url).json()
-            self.suspicious_list = requests.get(suspicious_list_url).json()
-        except Exception as e:
-            print(e)
+        async with ctx.typing():
+            changed = await self.refresh_checking_list()
+        if changed:
+            await ctx.send(f"Checking list updated, {len(self.domain_index)} entries loaded.")
+        else:
+            await ctx.send(f"Checking list is already up to date, {len(self.domain_index)} entries loaded.")
         
     @phishingchecker.command(name="action", aliases=["act"])
     async def set_action(self, ctx: commands.Context, action=""):
         """Set the action to take when a phishing link is detected. You can use `ban`, `kick` or `delete`. Leave empty to disable"""
         if action == "":
-            await self.config.guild(ctx.guild).set_raw("action", value="")
+            await self.set_guild_setting(ctx.guild, "action", "")
             await ctx.send("Phishing checker action disabled")
             return
         if action not in ["ban", "kick", "delete"]:
             await ctx.send("Invalid action. Valid actions are ban, kick and delete")
             return
-        await self.config.guild(ctx.guild).set_raw("action", value=action)
+        await self.set_guild_setting(ctx.guild, "action", action)
         await ctx.send("Phishing checker will take action {}".format(action))
 
     @phishingchecker.command(name="delete", aliases=["del"])
     async def set_always_delete(self, ctx: commands.Context, yes_or_no: bool):
         """Set if the bot should always delete the message when a phishing link is detected"""
-        await self.config.guild(ctx.guild).set_raw("always_delete", value=yes_or_no)
+        await self.set_guild_setting(ctx.guild, "always_delete", yes_or_no)
         await ctx.send("Phishing checker will {} delete the message".format("" if yes_or_no else "not"))
 
+    @phishingchecker.command(name="raid")
+    async def set_raid_threshold(self, ctx: commands.Context, threshold: int):
+        """Set how many hits of one domain within 10 seconds start raid mode. Use 0 to disable it
+
+        In raid mode every phishing message is bulk deleted, whatever the action is.
+        """
+        if threshold < 0:
+            await ctx.send("The threshold can't be negative.")
+            return
+        await self.set_guild_setting(ctx.guild, "raid_threshold", threshold)
+        if threshold:
+            await ctx.send(f"Raid mode will start after {threshold} hits of one domain within 10 seconds.")
+        else:
+            await ctx.send("Raid mode disabled.")
+
+    async def resume_scans(self) -> None:
+        await self.bot.wait_until_ready()
+        for guild_id, settings in self.guild_settings.items():
+            guild = self.bot.get_guild(guild_id)
+            if guild is not None and settings.get("scan") and guild_id not in self._scans:
+                self.start_scan(guild, settings["scan"])
+
+    def start_scan(self, guild: discord.Guild, state: dict) -> HistoryScan:
+        scan = HistoryScan(self, guild, state)
+
+        def done(task: asyncio.Task) -> None:
+            # a cancelled scan may already have been replaced by a new one
+            if self._scans.get(guild.id) is not scan:
+                return
+            del self._scans[guild.id]
+            if not task.cancelled() and task.exception() is not None:
+                log.error("Phishing scan failed in guild %s", guild.id, exc_info=task.exception())
+                # otherwise the failed scan would silently resume on the next load
+                asyncio.create_task(self.set_guild_setting(guild, "scan", None))
+
+        scan.task = asyncio.create_task(scan.run())
+        scan.task.add_done_callback(done)
+        self._scans[guild.id] = scan
+        return scan
+
+    @phishingchecker.group(name="scan", invoke_without_command=True)
+    async def scan_history(self, ctx: commands.Context, channels: commands.Greedy[discord.TextChannel]):
+        """Scan the message history of channels and delete phishing messages found there
+
+        Leave empty to scan every channel. Only links the feeds list as phishing are
+        deleted. The scan runs in the background and continues after a restart.
+        """
+        if ctx.guild.id in self._scans:
+            await ctx.send(f"A scan is already running. {self._scans[ctx.guild.id].describe()}")
+            return
+        if not channels:
+            channels = ctx.guild.text_channels
+        me = ctx.guild.me
+        channels = [
+            channel for channel in channels
+            if channel.permissions_for(me).read_message_history and channel.permissions_for(me).manage_messages
+        ]
+        if not channels:
+            await ctx.send("I can't read and manage messages in any of these channels.")
+            return
+        state = new_scan_state(channels, ctx.channel)
+        await self.set_guild_setting(ctx.guild, "scan", state)
+        self.start_scan(ctx.guild, state)
+
+    @scan_history.command(name="status")
+    async def scan_status(self, ctx: commands.Context):
+        """Show the progress of the running scan"""
+        scan = self._scans.get(ctx.guild.id)
+        if scan is None:
+            await ctx.send("No scan is running.")
+            return
+        await ctx.send(scan.describe())
+
+    @scan_history.command(name="cancel")
+    async def scan_cancel(self, ctx: commands.Context):
+        """Cancel the running scan"""
+        scan = self._scans.pop(ctx.guild.id, None)
+        if scan is None:
+            if self.get_guild_settings(ctx.guild)["scan"]:
+                # saved by a scan that was never resumed, like one of a guild unavailable at load
+                await self.set_guild_setting(ctx.guild, "scan", None)
+                await ctx.send("Cleared a saved scan that was not running.")
+            else:
+                await ctx.send("No scan is running.")
+            return
+        scan.task.cancel()
+        await self.set_guild_setting(ctx.guild, "scan", None)
+        await ctx.send(f"Scan cancelled. {scan.describe()}")
+
+    @commands.is_owner()
+    @phishingchecker.command(name="lookalike")
+    async def set_lookalike_threshold(self, ctx: commands.Context, threshold: float):
+        """Set how similar to a protected brand a domain must be to count as a lookalike
+
+        Use a value between 0.5 and 1, higher is stricter. Use 0 to disable lookalike detection.
+        Lookalikes are only alerted on, see `[p]phck lookalikeactions` to act on them too.
+        """
+        if threshold != 0 and not 0.5 <= threshold <= 1:
+            await ctx.send("The threshold must be 0, or between 0.5 and 1.")
+            return
+        await self.config.lookalike_threshold.set(threshold)
+        self.lookalikes.threshold = threshold
+        self.verdict_cache.clear()
+        if threshold:
+            await ctx.send(f"Lookalike threshold set to {threshold}.")
+        else:
+            await ctx.send("Lookalike detection disabled.")
+
+    @commands.is_owner()
+    @phishingchecker.command(name="lookalikeactions")
+    async def set_lookalike_actions(self, ctx: commands.Context, enabled: bool):
+        """Set whether each server's action also applies to lookalike domains
+
+        Lookalikes are guessed from their resemblance to protected brands, not taken from the feeds,
+        so by default they are only alerted on.
+        """
+        await self.config.lookalike_actions.set(enabled)
+        self.lookalike_actions = enabled
+        if enabled:
+            await ctx.send("Lookalike domains are now handled like listed links.")
+        else:
+            await ctx.send("Lookalike domains are now only alerted on.")
+
+    @commands.is_owner()
+    @phishingchecker.command(name="stats")
+    async def show_stats(self, ctx: commands.Context, reset: bool = False):
+        """Show counters and per-stage latencies of the checker, across all servers"""
+        metrics = self.metrics
+        lines = [f"Since {datetime.utcfromtimestamp(metrics.since):%Y-%m-%d %H:%M} UTC", ""]
+        for name in (
+            "messages_scanned", "urls_seen", "domains_seen", "hits_phishing", "hits_suspicious",
+            "hits_lookalike", "resolver_errors", "resolver_timeouts", "resolver_blocked",
+        ):
+            lines.append(f"{name:<18} {metrics.counters[name]:>10}")
+        lines.append("")
+        lines.append(f"{'stage':<8} {'count':>8} {'avg':>9} {'p50':>9} {'p99':>9} {'max':>9}")
+        for stage in ("extract", "resolve", "lookup", "alert", "action"):
+            histogram = metrics.histograms.get(stage)
+            if histogram is None or not histogram.count:
+                lines.append(f"{stage:<8} {0:>8}")
+                continue
+            lines.append(
+                f"{stage:<8} {histogram.count:>8} {format_seconds(histogram.total / histogram.count):>9} "
+                f"{format_seconds(histogram.percentile(0.5)):>9} {format_seconds(histogram.percentile(0.99)):>9} "
+                f"{format_seconds(histogram.max):>9}"
+            )
+        await ctx.send(cf.box("\n".join(lines)))
+        if reset:
+            metrics.reset()
+            await ctx.send("Statistics reset.")
+
     @phishingchecker.command(name="showsettings", aliases=["sets"])
     async def show_settings(self, ctx: commands.Context):
         """Show the current settings"""
-        enabled = await self.config.guild(ctx.guild).get_raw("enabled")
-        action = await self.config.guild(ctx.guild).get_raw("action")
-        channel = await self.config.guild(ctx.guild).get_raw("send_channel")
-        always_delete = await self.config.guild(ctx.guild).get_raw("always_delete")
+        settings = self.get_guild_settings(ctx.guild)
+        enabled = settings["enabled"]
+        action = settings["action"]
+        channel = settings["send_channel"]
+        always_delete = settings["always_delete"]
         if channel is None:
             channel = "Not set"
         else:
@@ -198,4 +723,140 @@ class PhishingChecker(commands.Cog):
         embed.add_field(name="Channel", value=f"{channel}", inline=False)
         embed.add_field(name="Action", value=f"`{action}`", inline=False)
         embed.add_field(name="Always delete", value=f"`{always_delete}`", inline=False)
-        await ctx.send(embed=embed)
\ No newline at end of file
+        raid = "active" if ctx.guild.id in self.raids.active else "inactive"
+        embed.add_field(
+            name="Raid mode",
+            value=f"`{settings['raid_threshold']}` hits in 10 seconds (currently {raid})",
+            inline=False,
+        )
+        embed.add_field(name="Lookalike threshold", value=f"`{self.lookalikes.threshold}`", inline=False)
+        lookalike_handling = "action and alert" if self.lookalike_actions else "alert only"
+        embed.add_field(name="Lookalike handling", value=f"`{lookalike_handling}`", inline=False)
+        cache = self.verdict_cache
+        hit_rate = "n/a" if cache.hit_rate is None else f"{cache.hit_rate:.1%}"
+        embed.add_field(
+            name="Alert queue",
+            value=(
+                f"`{self.alerts.depth(ctx.guild.id)}/{self.alerts.maxsize}` queued, "
+                f"`{self.alerts.dropped.get(ctx.guild.id, 0)}` dropped (oldest are dropped when full)"
+            ),
+            inline=False,
+        )
+        embed.add_field(
+            name="Verdict cache",
+            value=f"`{len(cache)}` entries, `{cache.hits}` hits, `{cache.misses}` misses ({hit_rate} hit rate)",
+            inline=False,
+        )
+        await ctx.send(embed=embed)
+
+    @commands.is_owner()
+    @phishingchecker.group(name="trusted")
+    async def trusted_hosts_group(self, ctx: commands.Context):
+        """Manage the hosts whose links are never checked"""
+
+    @trusted_hosts_group.command(name="add")
+    async def trusted_add(self, ctx: commands.Context, host: str):
+        """Trust a host and all of its subdomains"""
+        host, _ = split_url(host)
+        if not host:
+            await ctx.send("Invalid host.")
+            return
+        async with self.config.trusted_hosts() as trusted_hosts:
+            if host not in trusted_hosts:
+                trusted_hosts.append(host)
+            self.trusted_hosts = set(trusted_hosts)
+        await ctx.send(f"Links to {cf.inline(host)} will not be checked anymore.")
+
+    @trusted_hosts_group.command(name="remove", aliases=["del"])
+    async def trusted_remove(self, ctx: commands.Context, host: str):
+        """Stop trusting a host"""
+        host, _ = split_url(host)
+        async with self.config.trusted_hosts() as trusted_hosts:
+            if host not in trusted_hosts:
+                await ctx.send(f"{cf.inline(host)} is not a trusted host.")
+                return
+            trusted_hosts.remove(host)
+            self.trusted_hosts = set(trusted_hosts)
+        await ctx.send(f"Links to {cf.inline(host)} will be checked again.")
+
+    @trusted_hosts_group.command(name="list")
+    async def trusted_list(self, ctx: commands.Context):
+        """List the trusted hosts"""
+        if not self.trusted_hosts:
+            await ctx.send("There are no trusted hosts.")
+            return
+        for page in cf.pagify("\n".join(sorted(self.trusted_hosts))):
+            await ctx.send(cf.box(page))
+
+    @commands.is_owner()
+    @phishingchecker.group(name="feed")
+    async def feed_group(self, ctx: commands.Context):
+        """Manage the blocklist feeds"""
+
+    @feed_group.command(name="list", aliases=["stats"])
+    async def feed_list_command(self, ctx: commands.Context):
+        """Show every feed with its entry count and estimated memory use
+
+        Per-feed sizes are estimates of what the feed adds to the compiled index, which
+        shares entries listed by several feeds. The index total below is measured.
+        """
+        rows = []
+        for feed in self.feed_list:
+            state = self.feeds.states.get(feed.name, {})
+            if state.get("source") == feed.source:
+                entries, size = state["entries"], f"~{format_bytes(state['size'])} estimated"
+            else:
+                entries, size = "-", "not fetched"
+            rows.append(f"{feed.name} [{feed.category}, {feed.format}]: {entries} entries, {size}\n  {feed.source}")
+        rows.append(
+            f"\nCompiled index: {len(self.domain_index)} unique entries, "
+            f"{format_bytes(self.domain_index.nbytes)} resident"
+        )
+        for page in cf.pagify("\n".join(rows)):
+            await ctx.send(cf.box(page))
+
+    @feed_group.command(name="add")
+    async def feed_add(self, ctx: commands.Context, name: str, category: str, fmt: str, *, source: str):
+        """Add a feed
+
+        `category` is `phishing` or `suspicious`, `fmt` is `json` or `hosts`.
+        `source` is an http(s) URL or a path to a local file.
+        """
+        name = name.lower()
+        category = category.capitalize()
+        fmt = fmt.lower()
+        if not FEED_NAME_RE.match(name):
+            await ctx.send("Feed names may only contain letters, numbers, `-` and `_`.")
+            return
+        if category not in FEED_CATEGORIES:
+            await ctx.send(f"Invalid category. Valid categories are {cf.humanize_list(FEED_CATEGORIES)}.")
+            return
+        if fmt not in FEED_FORMATS:
+            await ctx.send(f"Invalid format. Valid formats are {cf.humanize_list(FEED_FORMATS)}.")
+            return
+        feed = Feed(name, source.strip("<>"), category, fmt)
+        async with self.config.feeds() as feeds:
+            feeds[:] = [f for f in feeds if f["name"] != name]
+            feeds.append(feed._asdict())
+            self.feed_list = [Feed(**f) for f in feeds]
+        async with ctx.typing():
+            await self.refresh_checking_list()
+        state = self.feeds.states.get(name, {})
+        if state.get("source") != feed.source:
+            await ctx.send(f"Feed {cf.inline(name)} added, but it could not be fetched yet. Check your logs.")
+            return
+        await ctx.send(f"Feed {cf.inline(name)} added with {state['entries']} entries.")
+
+    @feed_group.command(name="remove", aliases=["del"])
+    async def feed_remove(self, ctx: commands.Context, name: str):
+        """Remove a feed"""
+        async with self.config.feeds() as feeds:
+            if not any(f["name"] == name for f in feeds):
+                await ctx.send(f"There is no feed named {cf.inline(name)}.")
+                return
+            feeds[:] = [f for f in feeds if f["name"] != name]
+            self.feed_list = [Feed(**f) for f in feeds]
+        await self.feeds.remove(name)
+        async with self._refresh_lock:
+            await self.compile_checking_list()
+        await ctx.send(f"Feed {cf.inline(name)} removed.")
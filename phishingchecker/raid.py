@@ -0,0 +1,58 @@
+"""Sliding-window raid detection for the phishing checker."""
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class RaidDetector:
+    """Track how often each domain is hit per guild within a sliding window.
+
+    A guild enters raid mode once a single domain is hit ``threshold`` times
+    within ``window`` seconds, and leaves it once no domain is at that rate
+    anymore.
+    """
+
+    def __init__(self, window: float = 10.0):
+        self.window = window
+        # guild id -> domain -> hit timestamps
+        self._hits: Dict[int, Dict[str, Deque[float]]] = {}
+        # guild id -> time raid mode started
+        self.active: Dict[int, float] = {}
+
+    def _prune(self, guild_id: int, now: float) -> int:
+        """Drop hits older than the window, return the busiest domain's count."""
+        domains = self._hits.get(guild_id, {})
+        busiest = 0
+        for domain in list(domains):
+            hits = domains[domain]
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if not hits:
+                del domains[domain]
+            else:
+                busiest = max(busiest, len(hits))
+        return busiest
+
+    def record(self, guild_id: int, domain: str, threshold: int, now: Optional[float] = None) -> bool:
+        """Record a hit. Returns True if this hit started raid mode."""
+        if not threshold:
+            return False
+        now = time.monotonic() if now is None else now
+        hits = self._hits.setdefault(guild_id, {}).setdefault(domain, deque())
+        hits.append(now)
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        if guild_id not in self.active and len(hits) >= threshold:
+            self.active[guild_id] = now
+            return True
+        return False
+
+    def check_ended(self, guild_id: int, threshold: int, now: Optional[float] = None) -> bool:
+        """Returns True if the guild was in raid mode and the hit rate fell back."""
+        if guild_id not in self.active:
+            return False
+        now = time.monotonic() if now is None else now
+        if threshold and self._prune(guild_id, now) >= threshold:
+            return False
+        del self.active[guild_id]
+        return True
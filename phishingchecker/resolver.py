@@ -0,0 +1,213 @@
+"""Asynchronous redirect-chain resolver for the phishing checker."""
+import asyncio
+import ipaddress
+import logging
+import socket
+from typing import List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+
+from .domain_index import host_suffixes
+from .feeds import user_agent
+from .metrics import Metrics
+
+log = logging.getLogger("red.nyancogs.phishingchecker")
+
+# Servers that refuse HEAD, so the hop is retried with GET.
+HEAD_REJECTED = {400, 403, 404, 405, 501}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+# Link shorteners and redirectors, the only hosts whose links are resolved.
+KNOWN_SHORTENERS = frozenset(
+    {
+        "adf.ly",
+        "bit.do",
+        "bit.ly",
+        "bitly.com",
+        "bl.ink",
+        "buff.ly",
+        "clck.ru",
+        "cutt.ly",
+        "did.li",
+        "goo.gl",
+        "is.gd",
+        "j.mp",
+        "lnkd.in",
+        "ow.ly",
+        "qr.ae",
+        "rb.gy",
+        "rebrand.ly",
+        "s.id",
+        "shorte.st",
+        "shorturl.at",
+        "soo.gd",
+        "t.co",
+        "t.ly",
+        "tiny.cc",
+        "tinyurl.com",
+        "tr.im",
+        "u.to",
+        "urlz.fr",
+        "v.gd",
+        "x.co",
+    }
+)
+
+
+def is_internal(host: Optional[str]) -> bool:
+    """Whether ``host`` is localhost or an IP address outside the public internet.
+
+    Redirects come from links anyone can post, so following them to such a
+    host would let chat users make the bot request internal services. Host
+    names resolving to such an address are refused by ``PublicAddressResolver``,
+    this only catches what needs no DNS lookup.
+    """
+    if not host:
+        return True
+    # IPv6 link-local addresses may carry a zone, like fe80::1%eth0
+    host = host.rstrip(".").lower().split("%", 1)[0]
+    if host == "localhost" or host.endswith(".localhost"):
+        return True
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        try:
+            # also the shorthand forms resolvers accept, like 127.1 or 2130706433
+            address = ipaddress.IPv4Address(socket.inet_aton(host))
+        except OSError:
+            return False
+    return not address.is_global or address.is_multicast
+
+
+class InternalAddressError(OSError):
+    """A host name resolved to an address outside the public internet."""
+
+
+class PublicAddressResolver(AbstractResolver):
+    """Resolve host names with ``resolver``, refusing those with an internal address.
+
+    The connector connects to the addresses returned here, so a DNS record
+    pointing at 127.0.0.1 or a private network cannot slip past the check.
+    """
+
+    def __init__(self, resolver: Optional[AbstractResolver] = None):
+        self.resolver = resolver or aiohttp.DefaultResolver()
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        addresses = await self.resolver.resolve(host, port, family)
+        for address in addresses:
+            if is_internal(address["host"]):
+                raise InternalAddressError(f"{host} resolves to the internal address {address['host']}")
+        return addresses
+
+    async def close(self):
+        await self.resolver.close()
+
+
+def public_session() -> aiohttp.ClientSession:
+    """A session that never connects to hosts resolving to internal addresses."""
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(resolver=PublicAddressResolver()))
+
+
+class RedirectResolver:
+    """Follow a URL's redirects one hop at a time.
+
+    Every hop has its own deadline, the whole chain has a total deadline, the
+    number of hops is capped and only ``concurrency`` chains are followed at
+    once across the bot. Whatever part of the chain was resolved before a
+    deadline, error or the hop cap is still returned, flagged as incomplete.
+
+    ``session`` should come from ``public_session``, so redirects to hosts
+    resolving to internal addresses are refused.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        *,
+        max_hops: int = 10,
+        hop_timeout: float = 5.0,
+        total_timeout: float = 15.0,
+        concurrency: int = 20,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.session = session
+        self.metrics = metrics or Metrics()
+        self.shorteners = set(KNOWN_SHORTENERS)
+        self.max_hops = max_hops
+        self.hop_timeout = aiohttp.ClientTimeout(total=hop_timeout)
+        self.total_timeout = total_timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def is_shortener(self, host: str) -> bool:
+        """Whether links on ``host`` need to be resolved before they can be checked."""
+        return any(suffix in self.shorteners for suffix in host_suffixes(host))
+
+    async def _request(self, method: str, url: str) -> Tuple[int, Optional[str]]:
+        async with self.session.request(
+            method,
+            url,
+            allow_redirects=False,
+            timeout=self.hop_timeout,
+            headers={"user-agent": user_agent},
+        ) as resp:
+            return resp.status, resp.headers.get("Location")
+
+    async def _hop(self, url: str) -> Optional[str]:
+        """Return the absolute URL ``url`` redirects to, or None."""
+        try:
+            status, location = await self._request("HEAD", url)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status, location = None, None
+        if status is None or status in HEAD_REJECTED:
+            status, location = await self._request("GET", url)
+        if status not in REDIRECT_STATUSES or not location:
+            return None
+        return urljoin(url, location)
+
+    async def _follow(self, chain: List[str]) -> bool:
+        """Extend ``chain`` hop by hop, return whether it ended before the hop cap."""
+        seen = {chain[0]}
+        for _ in range(self.max_hops):
+            if is_internal(urlsplit(chain[-1]).hostname):
+                self.metrics.incr("resolver_blocked")
+                log.debug("Not following %s to an internal address", chain[-1])
+                return True
+            target = await self._hop(chain[-1])
+            if target is None or urlsplit(target).scheme not in ("http", "https"):
+                return True
+            chain.append(target)
+            if target in seen:
+                return True  # redirect loop
+            seen.add(target)
+        return False
+
+    async def resolve(self, url: str) -> Tuple[List[str], bool]:
+        """Return the redirect chain of ``url``, starting with ``url`` itself, and whether it is complete.
+
+        An incomplete chain stopped early, so its last URL need not be where the link leads.
+        """
+        if "://" not in url:
+            url = "http://" + url
+        chain = [url]
+        complete = False
+        async with self._semaphore:
+            try:
+                complete = await asyncio.wait_for(self._follow(chain), self.total_timeout)
+            except asyncio.TimeoutError:
+                self.metrics.incr("resolver_timeouts")
+                log.debug("Gave up resolving %s after %d hops", url, len(chain) - 1)
+            except aiohttp.ClientConnectorError as exc:
+                if isinstance(exc.os_error, InternalAddressError):
+                    complete = True
+                    self.metrics.incr("resolver_blocked")
+                    log.debug("Not following %s: %s", chain[-1], exc.os_error)
+                else:
+                    self.metrics.incr("resolver_errors")
+                    log.debug("Could not resolve %s: %r", chain[-1], exc)
+            except (aiohttp.ClientError, ValueError) as exc:
+                self.metrics.incr("resolver_errors")
+                log.debug("Could not resolve %s: %r", chain[-1], exc)
+        return chain, complete
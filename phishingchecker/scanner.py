@@ -0,0 +1,133 @@
+"""Resumable backfill scan of channel history for the phishing checker."""
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, List, Optional
+
+import discord
+from redbot.core.utils import chat_formatting as cf
+
+from .domain_index import PHISHING
+
+if TYPE_CHECKING:
+    from .phishingchecker import PhishingChecker
+
+log = logging.getLogger("red.nyancogs.phishingchecker")
+
+# Messages fetched and checked per page; also how often the cursor is saved.
+PAGE_SIZE = 100
+# Messages of one page checked at the same time. Kept low so that the resolver
+# still has room for live messages while a scan runs.
+SCAN_CONCURRENCY = 4
+PROGRESS_INTERVAL = 10
+
+
+def new_scan_state(channels: List[discord.TextChannel], report_channel: discord.abc.Messageable) -> dict:
+    return {
+        # channel id -> id of the oldest message scanned so far, or None if not started
+        "pending": {str(channel.id): None for channel in channels},
+        "total_channels": len(channels),
+        "scanned": 0,
+        "found": 0,
+        "report_channel": report_channel.id,
+    }
+
+
+class HistoryScan:
+    """Scan the history of a guild's channels, newest first, and delete phishing messages.
+
+    The scan state lives in the guild's ``scan`` setting and is saved after
+    every page, so a scan interrupted by a restart continues from the last
+    saved page.
+    """
+
+    def __init__(self, cog: "PhishingChecker", guild: discord.Guild, state: dict):
+        self.cog = cog
+        self.guild = guild
+        self.state = state
+        self.task: Optional[asyncio.Task] = None
+        self.progress_message: Optional[discord.Message] = None
+        self._last_progress = 0.0
+
+    @property
+    def done_channels(self) -> int:
+        return self.state["total_channels"] - len(self.state["pending"])
+
+    def describe(self) -> str:
+        return (
+            f"Scanned {cf.humanize_number(self.state['scanned'])} messages, "
+            f"{self.done_channels}/{self.state['total_channels']} channels done, "
+            f"{cf.humanize_number(self.state['found'])} phishing messages found and deleted."
+        )
+
+    async def _save(self) -> None:
+        await self.cog.set_guild_setting(self.guild, "scan", self.state)
+
+    async def _report(self, final: bool = False) -> None:
+        now = time.monotonic()
+        if not final and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        text = ("Phishing scan finished. " if final else "Phishing scan in progress... ") + self.describe()
+        try:
+            if self.progress_message is not None:
+                await self.progress_message.edit(content=text)
+                return
+            channel = self.guild.get_channel(self.state["report_channel"])
+            if channel is not None:
+                self.progress_message = await channel.send(text)
+        except discord.HTTPException:
+            pass
+
+    async def _check_page(self, page: List[discord.Message]) -> List[discord.Message]:
+        semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
+
+        async def check(message: discord.Message) -> bool:
+            async with semaphore:
+                result = await self.cog.scan_content(message.content, live=False)
+            # History is only cleaned of links the feeds list as phishing, never of
+            # suspicious or lookalike ones.
+            return result is not None and result[1] == PHISHING
+
+        candidates = [message for message in page if not message.author.bot and message.content]
+        results = await asyncio.gather(*(check(message) for message in candidates))
+        return [message for message, hit in zip(candidates, results) if hit]
+
+    async def _scan_page(self, channel: discord.TextChannel, page: List[discord.Message]) -> None:
+        hits = await self._check_page(page)
+        for job in self.cog.delete_jobs(hits):
+            try:
+                await job
+            except discord.HTTPException as exc:
+                log.warning("Could not delete scanned phishing messages in %s: %r", channel.id, exc)
+        self.state["scanned"] += len(page)
+        self.state["found"] += len(hits)
+        self.state["pending"][str(channel.id)] = page[-1].id
+        await self._save()
+        await self._report()
+
+    async def _scan_channel(self, channel: discord.TextChannel) -> None:
+        cursor = self.state["pending"][str(channel.id)]
+        before = discord.Object(cursor) if cursor else None
+        page = []
+        async for message in channel.history(limit=None, before=before):
+            page.append(message)
+            if len(page) >= PAGE_SIZE:
+                await self._scan_page(channel, page)
+                page = []
+        if page:
+            await self._scan_page(channel, page)
+
+    async def run(self) -> None:
+        await self._report()
+        for channel_id in list(self.state["pending"]):
+            channel = self.guild.get_channel(int(channel_id))
+            if channel is not None:
+                try:
+                    await self._scan_channel(channel)
+                except discord.Forbidden:
+                    log.info("Skipping channel %s in phishing scan, missing permissions", channel_id)
+            del self.state["pending"][channel_id]
+            await self._save()
+        await self._report(final=True)
+        await self.cog.set_guild_setting(self.guild, "scan", None)
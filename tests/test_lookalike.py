@@ -0,0 +1,60 @@
+import pytest
+
+from phishingchecker.domain_index import LOOKALIKE
+from phishingchecker.lookalike import LookalikeIndex
+
+LEGIT_HOSTS = (
+    "discord.com",
+    "cdn.discordapp.com",
+    "steamcommunity.com",
+    "discordpy.readthedocs.io",
+    "discordpy.dev",
+    "discordjs.guide",
+    "discord.js.org",
+    "discords.com",
+    "discordia.com",
+    "twitchy.com",
+    "github.com",
+    "docs.python.org",
+    "roblox.fandom.com",
+    "minecraft.fandom.com",
+    "discord.fandom.com",
+    "discord-py.readthedocs.io",
+    "minecraft.wiki",
+    "discord.me",
+    "discord.bio",
+)
+
+SCAM_HOSTS = (
+    ("discord-nitro.com", "discord.com"),
+    ("discord-gift.com", "discord.com"),
+    ("discordgift.com", "discord.com"),
+    ("discordnitro.gift", "discord.com"),
+    ("free-nitro-discord.ru", "discord.com"),
+    ("dlscord.com", "discord.com"),
+    ("steam-community.ru", "steamcommunity.com"),
+    ("steamcomrnunity.com", "steamcommunity.com"),
+    ("paypa1.com", "paypal.com"),
+)
+
+
+@pytest.fixture(scope="module")
+def index():
+    return LookalikeIndex()
+
+
+@pytest.mark.parametrize("host", LEGIT_HOSTS)
+def test_legit_hosts_are_not_lookalikes(index, host):
+    assert index.match(host) is None
+
+
+@pytest.mark.parametrize("host, brand_domain", SCAM_HOSTS)
+def test_scam_hosts_are_lookalikes(index, host, brand_domain):
+    verdict = index.match(host)
+    assert verdict is not None
+    assert verdict.category == LOOKALIKE
+    assert verdict.rule == brand_domain
+
+
+def test_threshold_zero_disables_matching():
+    assert LookalikeIndex(threshold=0).match("discord-nitro.com") is None